@@ -0,0 +1,487 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+
+import gameoflife as gol
+
+SCALING_WORKERS = [1, 2, 4, 8, 16]
+GUI_MODULES = ["tkinter", "PIL", "numpy", "multiprocessing"]
+
+METHUSELAHS = {
+    "r_pentomino": [(1, 0), (2, 0), (0, 1), (1, 1), (1, 2)],
+    "acorn": [(1, 0), (3, 1), (0, 2), (1, 2), (4, 2), (5, 2), (6, 2)],
+}
+SUITE_MASKS = ["gosper_glider_gun", "simkin_glider_gun", "pulsar", "heavy_ship"]
+SUITE_SOUP_SIZES = [10**3, 10**4, 10**5, 10**6]
+SOUP_DENSITY = 0.35
+PATTERN_GENERATIONS = 1000
+# soups run SOUP_CELL_GENERATIONS / cells generations, so every size does the same work
+SOUP_CELL_GENERATIONS = 5 * 10**6
+# per run: kill the run after RUN_TIMEOUT seconds
+RUN_TIMEOUT = 600.0
+ALLOCATION_SAMPLE_GENERATIONS = 5
+REGRESSION_TOLERANCE = 0.10
+RULE_ROUNDS = 3
+# row engine report: rules the shipped patterns are cross-checked under, soup densities
+CROSS_CHECK_RULES = ["B3/S23", "B36/S23", "B3678/S34678"]
+ROW_DENSITIES = [0.02, 0.05, 0.1, 0.2, 0.35, 0.5]
+# rules popup numbers (underpopulation, overpopulation, reborn) and the rule they stand for
+THRESHOLD_RULES = {(2, 3, 3): "B3/S23", (2, 3, 12): "B/S23", (2, 12, 3): "B3/S2345678", (1, 3, 11): "B/S123", (0, 8, 0): "B/S012345678"}
+
+def timeGenerations(gamestate, generations):
+    gamestate.updateCells() # warm-up: builds boards, pools and shared memory
+    start = perf_counter()
+    for i in range(generations):
+        gamestate.updateCells()
+    return generations / (perf_counter() - start)
+
+def scalingReport(size, density, generations, tileSize, seed):
+    soup = gol.randomSoup(size, size, density, seed)
+    print(f"Parallel engine scaling: {size}x{size} soup, density {density}, {len(soup)} cells, tile size {tileSize}")
+    print(f"{'workers':>8} {'gen/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in SCALING_WORKERS:
+        gamestate = gol.ParallelGameState(workers=workers, tileSize=tileSize)
+        gamestate.cells = list(soup)
+        try:
+            rate = timeGenerations(gamestate, generations)
+        finally:
+            gamestate.close()
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>10.2f} {rate / baseline:>7.2f}x")
+
+def importTimeReport(runs):
+    # -X importtime prints "import time: self | cumulative | module" per import on stderr
+    here = os.path.dirname(os.path.abspath(__file__))
+    check = "import sys, gameoflife; print(','.join(m for m in %r if m in sys.modules))" % GUI_MODULES
+    times = []
+    for i in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", check], cwd=here, capture_output=True, text=True, check=True)
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == "gameoflife":
+                times.append(int(parts[1]) / 1000)
+        loaded = proc.stdout.strip()
+    print(f"Headless import of gameoflife over {runs} runs: min {min(times):.1f} ms, median {median(times):.1f} ms")
+    print(f"Deferred modules loaded by the import: {loaded or 'none'}")
+
+def suiteWorkloads(soupSizes):
+    workloads = {}
+    for name in SUITE_MASKS:
+        try:
+            cells = gol.brushOrientations(gol.brushPath(gol.BrushType[name]))[0]
+        except ImportError:
+            print("Pillow is not installed and the brush cache is missing, skipping the brush mask workloads")
+            break
+        workloads[name] = (cells, PATTERN_GENERATIONS)
+    for name, cells in METHUSELAHS.items():
+        workloads[name] = (cells, PATTERN_GENERATIONS)
+    for count in soupSizes:
+        side = int((count / SOUP_DENSITY) ** 0.5)
+        workloads[f"soup_{count}"] = (gol.randomSoup(side, side, SOUP_DENSITY, seed=count), max(1, SOUP_CELL_GENERATIONS // count))
+    return workloads
+
+def runWorkload(engine, cells, generations, results):
+    # Runs in its own process so that ru_maxrss is the peak of this workload alone.
+    # Every run steps the same number of generations, so results compare across runs.
+    gamestate = gol.ENGINES[engine]()
+    gamestate.cells = list(cells)
+    processed = 0
+    elapsed = 0.0
+    for i in range(generations):
+        # reading cells builds the whole list on most engines, so it stays off the clock
+        processed += len(gamestate.cells)
+        start = perf_counter()
+        gamestate.updateCells()
+        elapsed += perf_counter() - start
+    # tracemalloc slows everything down, so allocations are sampled in a separate pass
+    tracemalloc.start()
+    blocks = 0
+    peaks = 0
+    for i in range(ALLOCATION_SAMPLE_GENERATIONS):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        startBlocks = sys.getallocatedblocks()
+        gamestate.updateCells()
+        blocks += sys.getallocatedblocks() - startBlocks
+        peaks += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    gamestate.close()
+    results.send({
+        "generations": generations,
+        "seconds": elapsed,
+        "genPerSec": generations / elapsed,
+        "cellsPerSec": processed / elapsed,
+        "finalPopulation": len(gamestate.cells),
+        "peakRssKb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "allocBytesPerGen": peaks / ALLOCATION_SAMPLE_GENERATIONS,
+        "netBlocksPerGen": blocks / ALLOCATION_SAMPLE_GENERATIONS,
+    })
+
+def runIsolated(engine, cells, generations, timeout):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=runWorkload, args=(engine, cells, generations, sender))
+    proc.start()
+    result = {"error": "timeout"}
+    if receiver.poll(timeout):
+        try:
+            result = receiver.recv()
+        except EOFError:
+            result = {"error": "crashed"}
+    proc.join(1)
+    if proc.is_alive():
+        proc.terminate()
+        proc.join()
+    elif proc.exitcode and "error" in result:
+        result = {"error": f"exit code {proc.exitcode}"}
+    return result
+
+class PerCellGameState(gol.GameState):
+    # The sparse engine as it was before rule tables: one generationStep call with
+    # chained threshold comparisons per candidate cell. Only knows B3/S23.
+    def updateCells(self):
+        self.cells = list(set(self.cells))
+        next_gen_cells = []
+        self.dead_cells = []
+        self.new_cells = []
+        self.cell_dict = dict(zip(self.cells, [0]*len(self.cells)))
+        self.potential_cells = {}
+        for cell in iter(self.cells):
+            self.greetNeighbours(cell)
+        for cell in self.cell_dict.keys():
+            if self.generationStep(self.cell_dict[cell], alive=True):
+                next_gen_cells.append(cell)
+            else:
+                self.dead_cells.append(cell)
+        for cell in self.potential_cells.keys():
+            if self.generationStep(self.potential_cells[cell], alive=False):
+                next_gen_cells.append(cell)
+                self.new_cells.append(cell)
+        self.cells = next_gen_cells
+
+    def generationStep(self, count, alive):
+        return (alive and count >= 2 and count <= 3) or ((not alive) and count == 3)
+
+def thresholdNextBoard(board, counts):
+    # the dense step as it was before rule tables, for B3/S23
+    survive = (counts >= 2) & (counts <= 3)
+    return (board & survive) | (~board & (counts == 3))
+
+def ruleReport(size, denseSize, density, generations, seed):
+    soup = gol.randomSoup(size, size, density, seed)
+    print(f"Rule evaluation, B3/S23: sparse engine on a {size}x{size} soup ({len(soup)} cells), dense rule step on {denseSize}x{denseSize}")
+    print(f"{'engine':<24} {'gen/s':>10} {'speedup':>8}")
+    rates = {}
+    # alternating rounds, best of each, so that a noisy neighbour hits both paths alike
+    for i in range(RULE_ROUNDS):
+        for name, gamestate in [("sparse per-cell calls", PerCellGameState()), ("sparse rule table", gol.GameState())]:
+            gamestate.cells = list(soup)
+            rates[name] = max(rates.get(name, 0), timeGenerations(gamestate, generations))
+    if gol.HAVE_NUMPY:
+        np = gol.loadNumpy()
+        board = np.random.default_rng(seed).random((denseSize, denseSize)) < density
+        counts = gol.denseNeighbourCounts(board)
+        ranges = gol.GameState().ruleRanges
+        for i in range(RULE_ROUNDS):
+            for name, step in [("dense thresholds", lambda: thresholdNextBoard(board, counts)),
+                               ("dense rule ranges", lambda: gol.denseNextBoard(board, counts, ranges))]:
+                start = perf_counter()
+                for j in range(generations):
+                    step()
+                rates[name] = max(rates.get(name, 0), generations / (perf_counter() - start))
+    baseline = None
+    for name, rate in rates.items():
+        if name.endswith("per-cell calls") or name.endswith("thresholds"):
+            baseline = rate
+        print(f"{name:<24} {rate:>10.2f} {rate / baseline:>7.2f}x")
+
+def formatReport(count, seed, directory):
+    side = int((count / SOUP_DENSITY) ** 0.5)
+    cells = gol.randomSoup(side, side, SOUP_DENSITY, seed)
+    print(f"State file throughput: {len(cells)} cells ({side}x{side} soup)")
+    print(f"{'format':<16} {'size MB':>9} {'save s':>8} {'load s':>8} {'save Mc/s':>10} {'load Mc/s':>10} {'load vs txt':>12}")
+    textLoad = None
+    for name, ext, compress in [("text", ".txt", True), ("rle", ".rle", True), ("plaintext", ".cells", True),
+                                ("binary", ".golb", False), ("binary+zlib", ".golb", True)]:
+        filename = os.path.join(directory, "benchmark_state" + ext)
+        start = perf_counter()
+        gol.saveCells(filename, cells, compress)
+        saved = perf_counter() - start
+        start = perf_counter()
+        loaded = gol.loadCells(filename)
+        load = perf_counter() - start
+        size = os.path.getsize(filename) / 2**20
+        os.remove(filename)
+        assert len(loaded) == len(cells)
+        textLoad = textLoad or load
+        print(f"{name:<16} {size:>9.2f} {saved:>8.3f} {load:>8.3f} {len(cells) / saved / 1e6:>10.2f} {len(cells) / load / 1e6:>10.2f} {textLoad / load:>11.1f}x")
+
+def measureMemory(engine, count, seed, results):
+    # Runs in its own process: objects and free lists left over by an earlier size
+    # would otherwise be reused and hide part of what this one allocates
+    side = int((count / SOUP_DENSITY) ** 0.5)
+    # a throwaway engine pays for lazy imports and caches outside the traced region
+    warmup = gol.ENGINES[engine]()
+    warmup.cells = gol.randomSoup(8, 8, SOUP_DENSITY, seed)
+    warmup.updateCells()
+    warmup.close()
+    del warmup
+    # full collections also empty the free lists, which would otherwise hand out
+    # untraced tuples here and keep the dropped input tuples counted below
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    gamestate = gol.ENGINES[engine]()
+    # the soup is built under tracing so the sparse engine's tuples are counted
+    cells = gol.randomSoup(side, side, SOUP_DENSITY, seed)
+    population = len(cells)
+    gamestate.cells = cells
+    del cells
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    gamestate.updateCells()
+    step = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    results.send((population, held, step))
+
+def memoryReport(sizes, seed):
+    print("Memory per live cell: population held by each engine, and the peak allocated while stepping one generation")
+    print(f"{'engine':<10} {'cells':>9} {'held B/cell':>12} {'step B/cell':>12} {'vs sparse':>10}")
+    for count in sizes:
+        sparse = None
+        for engine in ["sparse", "packed"]:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(target=measureMemory, args=(engine, count, seed, sender))
+            proc.start()
+            population, held, step = receiver.recv()
+            proc.join()
+            sparse = sparse or held
+            print(f"{engine:<10} {population:>9} {held / population:>12.1f} {step / population:>12.1f} {held / sparse:>9.2f}x")
+
+def crossCheck(engine, cells, rule, generations, edits=None):
+    # The first generation where engine and the sparse engine disagree, or None.
+    # edits maps a generation to (cells to add, cells to remove) before it is stepped.
+    reference = gol.GameState()
+    gamestate = gol.ENGINES[engine]()
+    for state in (reference, gamestate):
+        state.setRule(rule)
+        state.cells = list(cells)
+    try:
+        for generation in range(1, generations + 1):
+            if edits and generation in edits:
+                added, removed = edits[generation]
+                for state in (reference, gamestate):
+                    state.addCells(added)
+                    state.removeCells(removed)
+            reference.updateCells()
+            gamestate.updateCells()
+            if set(gamestate.new_cells) != set(reference.new_cells) or set(gamestate.dead_cells) != set(reference.dead_cells) \
+                    or set(gamestate.cells) != reference.cellSet:
+                return generation
+        return None
+    finally:
+        gamestate.close()
+
+def engineCheck(engines, generations):
+    block = [(0, 0), (1, 0), (0, 1), (1, 1)]
+    glider = [(1, 0), (2, 1), (0, 2), (1, 2), (2, 2)]
+    blinker = [(0, 0), (1, 0), (2, 0)]
+    far = 200
+    cases = {
+        "lone cell": ([(5, 5)], None),
+        "sparse": ([(5, 5), (-90, 40)] + [(x + far, y) for x, y in blinker] + [(x, y - far) for x, y in block]
+                   + [(x - far, y + far) for x, y in glider], None),
+        # cells stamped next to and removed from settled objects, as GUI clicks do
+        "edits": (block + [(x + 40, y) for x, y in blinker], {
+            5: ([(2, 0)], []),
+            12: ([(x + far, y) for x, y in glider], [(41, 0)]),
+            20: ([(-1, -1), (40, 5)], [(0, 0)]),
+            30: ([(5, 5)], []),
+        }),
+    }
+    print(f"Cross-check of every engine against the sparse engine, {generations} generations")
+    ok = True
+    for engine in engines:
+        for name, (cells, edits) in cases.items():
+            try:
+                generation = crossCheck(engine, cells, gol.DEFAULT_RULE, generations, edits)
+            except RuntimeError as e:
+                print(f"{engine}: skipped, {e}")
+                break
+            if generation is not None:
+                print(f"{engine} on {name}: differs at generation {generation}")
+                ok = False
+    print("all engines match" if ok else "MISMATCH")
+    return ok
+
+def thresholdCheck():
+    # the rules popup numbers against the rulestrings they meant before rulestrings
+    print("Rules popup thresholds against the rules they stood for")
+    ok = True
+    for thresholds, expected in THRESHOLD_RULES.items():
+        rule = gol.thresholdRule(*thresholds)
+        if gol.parseRule(rule) != gol.parseRule(expected):
+            print(f"thresholds {thresholds}: {rule}, expected {expected}")
+            ok = False
+    print("all thresholds match" if ok else "MISMATCH")
+    return ok
+
+def rowReport(size, generations, seed):
+    patterns = dict(METHUSELAHS)
+    for brush in gol.BrushType:
+        if brush in (gol.BrushType.default, gol.BrushType.SIZE):
+            continue
+        try:
+            patterns[brush.name] = gol.brushOrientations(gol.brushPath(brush))[0]
+        except ImportError:
+            print("Pillow is not installed and the brush cache is missing, checking the methuselahs only")
+            break
+    print(f"Cross-check of the row engine against the sparse engine, {PATTERN_GENERATIONS} generations")
+    ok = True
+    for rule in CROSS_CHECK_RULES:
+        for name, cells in patterns.items():
+            generation = crossCheck("rows", cells, rule, PATTERN_GENERATIONS)
+            if generation is not None:
+                print(f"{name} under {rule}: differs at generation {generation}")
+                ok = False
+    print("all patterns match" if ok else "MISMATCH")
+    engines = ["sparse", "rows"] + (["packed", "dense"] if gol.HAVE_NUMPY else [])
+    print(f"Generations/sec on a {size}x{size} soup, {generations} generations")
+    print(f"{'density':>8} {'cells':>8} " + " ".join(f"{engine:>10}" for engine in engines) + f" {'rows vs sparse':>15}")
+    for density in ROW_DENSITIES:
+        soup = gol.randomSoup(size, size, density, seed)
+        rates = {}
+        for engine in engines:
+            gamestate = gol.ENGINES[engine]()
+            gamestate.cells = list(soup)
+            rates[engine] = timeGenerations(gamestate, generations)
+            gamestate.close()
+        print(f"{density:>8.2f} {len(soup):>8} " + " ".join(f"{rates[engine]:>10.1f}" for engine in engines) + f" {rates['rows'] / rates['sparse']:>14.1f}x")
+    return ok
+
+def benchmarkSuite(engines, workloadNames, soupSizes, output, baseline, tolerance, timeout):
+    if workloadNames:
+        soupSizes = [count for count in soupSizes if f"soup_{count}" in workloadNames]
+    workloads = suiteWorkloads(soupSizes)
+    if workloadNames:
+        workloads = {name: workloads[name] for name in workloadNames}
+    meta = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": gol.loadNumpy().__version__ if gol.HAVE_NUMPY else None,
+    }
+    results = []
+    print(f"{'workload':<20} {'engine':<10} {'gens':>6} {'gen/s':>10} {'cells/s':>12} {'rss MB':>8} {'alloc KB/gen':>13}")
+    for name, (cells, generations) in workloads.items():
+        for engine in engines:
+            result = runIsolated(engine, cells, generations, timeout)
+            result.update(workload=name, engine=engine, initialPopulation=len(cells))
+            results.append(result)
+            if "error" in result:
+                print(f"{name:<20} {engine:<10} {result['error']}")
+            else:
+                print(f"{name:<20} {engine:<10} {result['generations']:>6} {result['genPerSec']:>10.1f} {result['cellsPerSec']:>12.0f} "
+                      f"{result['peakRssKb'] / 1024:>8.1f} {result['allocBytesPerGen'] / 1024:>13.1f}")
+    if output:
+        with open(output, 'w') as fd:
+            json.dump({"meta": meta, "results": results}, fd, indent=1)
+    if baseline:
+        return compareBaseline(results, baseline, tolerance)
+    return True
+
+def compareBaseline(results, baseline, tolerance):
+    with open(baseline, 'r') as fd:
+        previous = {(r["workload"], r["engine"]): r for r in json.load(fd)["results"]}
+    ok = True
+    print(f"\nAgainst baseline {baseline} (tolerance {tolerance:.0%}):")
+    for result in results:
+        old = previous.get((result["workload"], result["engine"]))
+        if old is None or "error" in old or "error" in result:
+            continue
+        if old["generations"] != result["generations"]:
+            # gen/s over a different number of generations measures a different workload
+            print(f"{result['workload']:<20} {result['engine']:<10} skipped, {old['generations']} generations in the baseline")
+            continue
+        ratio = result["genPerSec"] / old["genPerSec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{result['workload']:<20} {result['engine']:<10} {ratio:>6.2f}x{flag}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Game of Life engine benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scaling = subparsers.add_parser("scaling", help="generations/sec of the parallel engine at 1-16 workers")
+    scaling.add_argument("--size", type=int, default=2048)
+    scaling.add_argument("--density", type=float, default=0.35)
+    scaling.add_argument("--generations", type=int, default=50)
+    scaling.add_argument("--tile-size", type=int, default=gol.PARALLEL_TILE_SIZE)
+    scaling.add_argument("--seed", type=int, default=1)
+    importTime = subparsers.add_parser("import-time", help="cold import time of the headless module")
+    importTime.add_argument("--runs", type=int, default=10)
+    suite = subparsers.add_parser("suite", help="canonical workloads on every engine, each in a fresh process")
+    suite.add_argument("--engines", nargs="+", choices=gol.ENGINES.keys(), default=list(gol.ENGINES.keys()))
+    suite.add_argument("--workloads", nargs="+", help="only run these workloads")
+    suite.add_argument("--soup-sizes", nargs="+", type=int, default=SUITE_SOUP_SIZES)
+    suite.add_argument("--timeout", type=float, default=RUN_TIMEOUT)
+    suite.add_argument("-o", "--output", help="write the results as JSON")
+    suite.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    suite.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    formats = subparsers.add_parser("formats", help="save/load throughput of every state file format")
+    formats.add_argument("--cells", type=int, default=10**6)
+    formats.add_argument("--seed", type=int, default=1)
+    formats.add_argument("--dir", default=".", help="where to write the temporary files")
+    memory = subparsers.add_parser("memory", help="bytes per live cell of the sparse and packed engines, each size in a fresh process")
+    memory.add_argument("--sizes", nargs="+", type=int, default=SUITE_SOUP_SIZES)
+    memory.add_argument("--seed", type=int, default=1)
+    check = subparsers.add_parser("check", help="rules popup thresholds, and every engine against the sparse engine on sparse starts and edits")
+    check.add_argument("--engines", nargs="+", choices=gol.ENGINES.keys(), default=list(gol.ENGINES.keys()))
+    check.add_argument("--generations", type=int, default=60)
+    rows = subparsers.add_parser("rows", help="row engine: cross-check on the shipped patterns and generations/sec by density")
+    rows.add_argument("--size", type=int, default=256)
+    rows.add_argument("--generations", type=int, default=20)
+    rows.add_argument("--seed", type=int, default=1)
+    rules = subparsers.add_parser("rules", help="compiled rule tables against the old per-cell rule checks")
+    rules.add_argument("--size", type=int, default=300)
+    rules.add_argument("--dense-size", type=int, default=2000)
+    rules.add_argument("--density", type=float, default=0.35)
+    rules.add_argument("--generations", type=int, default=10)
+    rules.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "scaling":
+        scalingReport(args.size, args.density, args.generations, args.tile_size, args.seed)
+    elif args.command == "import-time":
+        importTimeReport(args.runs)
+    elif args.command == "rules":
+        ruleReport(args.size, args.dense_size, args.density, args.generations, args.seed)
+    elif args.command == "check":
+        ok = thresholdCheck()
+        if not engineCheck(args.engines, args.generations) or not ok:
+            sys.exit(1)
+    elif args.command == "rows":
+        if not rowReport(args.size, args.generations, args.seed):
+            sys.exit(1)
+    elif args.command == "memory":
+        memoryReport(args.sizes, args.seed)
+    elif args.command == "formats":
+        formatReport(args.cells, args.seed, args.dir)
+    elif args.command == "suite":
+        if not benchmarkSuite(args.engines, args.workloads, args.soup_sizes, args.output, args.baseline, args.tolerance, args.timeout):
+            sys.exit(1)
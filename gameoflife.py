@@ -1,20 +1,71 @@
-import tkinter as tk
-from tkinter import filedialog
-from tkinter.messagebox import showerror
-from PIL import Image
-
-from time import sleep, time
-import math
-from collections import deque
+from importlib.machinery import PathFinder
+from time import perf_counter
 from enum import Enum
+from collections import deque
+from array import array
+import mmap
 import os
-
-FPS = 30
-CANVAS_SIZE = (1000, 800)
-UPDATE_FREQS = [500, 250, 125, 60, 30]
-MAX_CELLSIZE = 100
-ZOOM_FREQ = 0.5
-UNDO_HISTORY_LENGTH = 1000
+import struct
+import sys
+import zlib
+
+# numpy, multiprocessing, PIL and tkinter are imported on first use so that
+# headless runs start quickly and work on machines without a display
+np = None
+HAVE_NUMPY = PathFinder.find_spec("numpy") is not None
+
+# State files: RLE line width, binary format magic/version, tile edge (1 << shift),
+# tiles packed per numpy batch and zlib level
+RLE_LINE_LENGTH = 70
+BINARY_MAGIC = b"GOLB"
+BINARY_VERSION = 1
+BINARY_TILE_SHIFT = 6
+BINARY_TILE_BATCH = 4096
+BINARY_COMPRESSION_LEVEL = 1
+# cells parsed between progress reports when loading in chunks
+LOAD_CHUNK_CELLS = 1 << 16
+
+# Life-like rule every engine starts with
+DEFAULT_RULE = "B3/S23"
+# Dense engine: free border kept around the live region, and how often it is re-fitted
+DENSE_MARGIN = 8
+DENSE_FIT_INTERVAL = 16
+# Adaptive engine: population density thresholds for switching sparse <-> dense
+DENSE_MIN_POPULATION = 256
+DENSE_ENTER_DENSITY = 0.01
+DENSE_LEAVE_DENSITY = 0.005
+DENSITY_CHECK_INTERVAL = 16
+# Adaptive engine: largest bounding box (in cells) it will hold as a dense board
+DENSE_MAX_AREA = 1 << 24
+# Packed engine: cells are stored as x + PACKED_BIAS, y + PACKED_BIAS in 32 bits each
+PACKED_BIAS = 1 << 30
+# Row engine: free bits kept below the lowest live column of the row bitmasks
+ROW_MARGIN = 64
+# Active-region engine: chunk edge length is 1 << CHUNK_SHIFT
+CHUNK_SHIFT = 4
+# Parallel engine: edge length of the tiles handed to each worker
+PARALLEL_TILE_SIZE = 256
+# HashLife engine: node/memo cache cap before eviction
+HASHLIFE_MAX_NODES = 1 << 21
+# Cycle detection: hash modulus and per-axis bases, number of recent generations remembered
+CYCLE_HASH_MODULUS = (1 << 61) - 1
+CYCLE_HASH_BASES = (0x2545F4914F6CDD1D, 0x5851F42D4C957F2D)
+CYCLE_HISTORY = 4096
+# Sweeps: result file magic/version, completed runs between progress lines
+SWEEP_MAGIC = b"GOLS"
+SWEEP_VERSION = 1
+SWEEP_REPORT_INTERVAL = 100
+# Census: longest period recognised, generations between checks whether a soup has
+# settled, Chebyshev distance within which live cells count as one object, cache file
+CENSUS_MAX_PERIOD = 30
+CENSUS_CHECK_INTERVAL = 50
+CENSUS_OBJECT_DISTANCE = 2
+CENSUS_CACHE = "census_cache.json"
+# Brushes: directory of the PNG masks, compiled brush cache file inside it, its magic/version
+BRUSH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brushmasks")
+BRUSH_CACHE_FILE = ".brushcache"
+BRUSH_CACHE_MAGIC = b"GOLM"
+BRUSH_CACHE_VERSION = 1
 
 class BrushType(Enum):
     default = 0 # has no mask
@@ -33,74 +84,573 @@ class BrushType(Enum):
     # size of enum is manually updated
     SIZE = 12
 
-BrushMasks = [None for i in range(BrushType.SIZE.value)]
+def loadNumpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("This engine requires numpy")
+        np = numpy
+    return np
+
+# The 8 symmetries of the square as (xx, xy, yx, yy), mapping (x, y) to
+# (xx*x + xy*y, yx*x + yy*y): the four clockwise quarter turns (with y pointing down),
+# then the same four turns applied after a left-right mirror
+ORIENTATIONS = [(1, 0, 0, 1), (0, -1, 1, 0), (-1, 0, 0, -1), (0, 1, -1, 0),
+                (-1, 0, 0, 1), (0, -1, -1, 0), (1, 0, 0, -1), (0, 1, 1, 0)]
+
+def orient(cells, orientation):
+    # cells under ORIENTATIONS[orientation], moved so their bounding box starts at (0, 0)
+    xx, xy, yx, yy = ORIENTATIONS[orientation]
+    moved = [(xx*x + xy*y, yx*x + yy*y) for x, y in cells]
+    if not moved:
+        return moved
+    minx = min(x for x, y in moved)
+    miny = min(y for x, y in moved)
+    return [(x - minx, y - miny) for x, y in moved]
+
+def canonicalCells(cells):
+    # the same sorted tuple for every rotation, reflection and translation of the cells
+    return min(tuple(sorted(orient(cells, orientation))) for orientation in range(len(ORIENTATIONS)))
+
+class StateFileError(ValueError):
+    def __init__(self, line, reason=None):
+        if line is None:
+            ValueError.__init__(self, "Error loading state save file: %s" % reason)
+        else:
+            ValueError.__init__(self, "Error loading state save file on line %d" % line)
+        self.line = line
+
+### State files ###
+# .txt is one "x,y" line per cell, .rle and .cells are the standard Life pattern
+# formats and .golb is the packed binary format below.
+def stateFormat(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext in STATE_FORMATS else ".txt"
+
+def loadCells(filename):
+    fmt = stateFormat(filename)
+    if fmt == ".golb":
+        return loadBinaryCells(filename)
+    with open(filename, 'r') as fd:
+        return list(STATE_READERS[fmt](fd))
+
+def iterCellChunks(filename, chunkSize=LOAD_CHUNK_CELLS):
+    # Yields (cells, fraction of the file read) every chunkSize cells, so a caller can
+    # report progress and stop early. The last chunk has fraction 1.0.
+    fmt = stateFormat(filename)
+    if fmt == ".golb":
+        with open(filename, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size < BINARY_HEADER.size:
+                raise StateFileError(None, "truncated header")
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                chunk = []
+                for fraction, cells in iterBinaryTiles(mm):
+                    chunk.extend(cells)
+                    if len(chunk) >= chunkSize:
+                        yield chunk, fraction
+                        chunk = []
+        yield chunk, 1.0
+        return
+    with open(filename, 'r') as fd:
+        size = os.fstat(fd.fileno()).st_size or 1
+        chunk = []
+        for cell in STATE_READERS[fmt](fd):
+            chunk.append(cell)
+            if len(chunk) >= chunkSize:
+                # the byte position runs ahead of the parser by at most one read buffer
+                yield chunk, min(1.0, fd.buffer.tell() / size)
+                chunk = []
+    yield chunk, 1.0
+
+def saveCells(filename, cells, compress=True):
+    fmt = stateFormat(filename)
+    if fmt == ".golb":
+        saveBinaryCells(filename, cells, compress)
+        return
+    with open(filename, 'w') as fd:
+        STATE_WRITERS[fmt](fd, cells)
+
+def iterTextCells(fd):
+    for linecount, line in enumerate(fd, 1):
+        cell_parts = line.split(',')
+        try:
+            if len(cell_parts) != 2:
+                raise ValueError
+            yield (int(cell_parts[0]), int(cell_parts[1]))
+        except ValueError:
+            raise StateFileError(linecount)
+
+def writeTextCells(fd, cells):
+    for cell in cells:
+        fd.write(f"{cell[0]},{cell[1]}\n")
 
-def loadBrushMasks():
-    rootdir = os.path.split(os.path.abspath(__file__))[0] + '/brushmasks/'
-    for root, dirs, files in os.walk(rootdir):
-        for filename in files:
-            try:
-                im = Image.open(f"{rootdir}/{filename}")
-                pixels = im.load()
-            except Exception as e:
-                print("loadBrushMasks:", e)
-                continue
-            mask = []
-            for i in range(im.size[0]):
-                mask.append([])
-                for j in range(im.size[1]):
-                    if pixels[i,j][0] == 0: # black
-                        mask[i].append(1)
-                    else:
-                        mask[i].append(0)
+RLE_TOKEN = None # compiled on first use, re is slow to import
+
+def cellRows(cells):
+    # {y: sorted xs}; grouping by row first is much cheaper than sorting (x, y) tuples
+    rows = {}
+    for x, y in cells:
+        try:
+            rows[y].append(x)
+        except KeyError:
+            rows[y] = [x]
+    for xs in rows.values():
+        xs.sort()
+    return rows, min(xs[0] for xs in rows.values())
+
+def iterRleCells(fd):
+    global RLE_TOKEN
+    if RLE_TOKEN is None:
+        import re
+        RLE_TOKEN = re.compile(r"\s*(\d*)([A-Za-z.$!])")
+    ox, oy = 0, 0
+    x, y = 0, 0
+    seenHeader = False
+    for linecount, line in enumerate(fd, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            # Golly's extended header keeps the absolute position of the pattern
+            if line.startswith('#CXRLE'):
+                for field in line.split()[1:]:
+                    if field.startswith('Pos='):
+                        try:
+                            ox, oy = (int(v) for v in field[4:].split(','))
+                        except ValueError:
+                            raise StateFileError(linecount)
+            continue
+        if not seenHeader and line.startswith('x'):
+            seenHeader = True
+            continue
+        pos = 0
+        for match in RLE_TOKEN.finditer(line):
+            if match.start() != pos and line[pos:match.start()].strip():
+                raise StateFileError(linecount)
+            pos = match.end()
+            count = int(match.group(1)) if match.group(1) else 1
+            tag = match.group(2)
+            if tag == 'b' or tag == '.':
+                x += count
+            elif tag == '$':
+                x = 0
+                y += count
+            elif tag == '!':
+                return
+            else:
+                for i in range(count):
+                    yield (ox + x + i, oy + y)
+                x += count
+        if line[pos:].strip():
+            raise StateFileError(linecount)
+
+def writeRleCells(fd, cells, rule=None):
+    if not cells:
+        fd.write("x = 0, y = 0\n!\n")
+        return
+    rows, minx = cellRows(cells)
+    ys = sorted(rows)
+    maxx = max(xs[-1] for xs in rows.values())
+    fd.write(f"#CXRLE Pos={minx},{ys[0]}\n")
+    fd.write(f"x = {maxx - minx + 1}, y = {ys[-1] - ys[0] + 1}" + (f", rule = {rule}\n" if rule else "\n"))
+    line = []
+    width = 0
+    def emit(count, tag):
+        nonlocal width
+        token = f"{count}{tag}" if count > 1 else tag
+        if width + len(token) > RLE_LINE_LENGTH:
+            fd.write("".join(line) + "\n")
+            line.clear()
+            width = 0
+        line.append(token)
+        width += len(token)
+    lasty = ys[0]
+    for y in ys:
+        if y != lasty:
+            emit(y - lasty, '$')
+            lasty = y
+        xs = rows[y]
+        x = minx
+        i = 0
+        while i < len(xs):
+            start = xs[i]
+            if start > x:
+                emit(start - x, 'b')
+            run = 1
+            while i + run < len(xs) and xs[i + run] == start + run:
+                run += 1
+            emit(run, 'o')
+            x = start + run
+            i += run
+    emit(1, '!')
+    fd.write("".join(line) + "\n")
+
+def iterPlaintextCells(fd):
+    y = 0
+    for linecount, line in enumerate(fd, 1):
+        line = line.rstrip('\r\n')
+        if line.startswith('!'):
+            continue
+        for x, ch in enumerate(line):
+            if ch == 'O' or ch == '*':
+                yield (x, y)
+            elif ch != '.' and not ch.isspace():
+                raise StateFileError(linecount)
+        y += 1
+
+def writePlaintextCells(fd, cells):
+    # plaintext has no origin, the pattern is stored from its top-left corner
+    if not cells:
+        return
+    rows, minx = cellRows(cells)
+    ys = sorted(rows)
+    for y in range(ys[0], ys[-1] + 1):
+        row = bytearray(b".") * (rows[y][-1] - minx + 1) if y in rows else bytearray(b".")
+        for x in rows.get(y, ()):
+            row[x - minx] = 79 # 'O'
+        fd.write(row.decode() + "\n")
+
+STATE_READERS = {".txt": iterTextCells, ".rle": iterRleCells, ".cells": iterPlaintextCells}
+STATE_WRITERS = {".txt": writeTextCells, ".rle": writeRleCells, ".cells": writePlaintextCells}
+STATE_FORMATS = [".txt", ".rle", ".cells", ".golb"]
+
+### Binary state files ###
+# Header (magic, version, flags, tile shift, tile count, index offset), then one packed
+# bitmap per occupied tile (row-major, most significant bit first, optionally zlib
+# compressed), then an index of (tile x, tile y, offset, length) entries. Tiles are
+# read straight out of a memory map.
+BINARY_HEADER = struct.Struct("<4sBBBxQQ")
+BINARY_TILE = struct.Struct("<iiQI")
+BINARY_FLAG_ZLIB = 1
+
+def binaryTiles(cells, shift):
+    # yields (tx, ty, packed bitmap) for every occupied tile
+    size = 1 << shift
+    mask = size - 1
+    # tile indices are stored as int32
+    outOfRange = ValueError(f"The binary format only holds coordinates in [{-(1 << 31 + shift)}, {1 << 31 + shift})")
+    if HAVE_NUMPY:
+        loadNumpy()
+        try:
+            coords = np.array(list(cells), dtype=np.int64).reshape(-1, 2)
+        except OverflowError:
+            raise outOfRange
+        if len(coords) == 0:
+            return
+        tiles = coords >> shift
+        if tiles.min() < -(1 << 31) or tiles.max() >= 1 << 31:
+            raise outOfRange
+        order = np.lexsort((tiles[:, 0], tiles[:, 1]))
+        coords, tiles = coords[order], tiles[order]
+        starts = np.flatnonzero(np.any(tiles[1:] != tiles[:-1], axis=1)) + 1
+        starts = np.concatenate(([0], starts, [len(tiles)]))
+        bits = (coords[:, 1] & mask) * size + (coords[:, 0] & mask)
+        for b in range(0, len(starts) - 1, BINARY_TILE_BATCH):
+            first = starts[b:b + BINARY_TILE_BATCH + 1]
+            batch = np.zeros((len(first) - 1, size * size), dtype=bool)
+            rows = np.repeat(np.arange(len(first) - 1), np.diff(first))
+            batch[rows, bits[first[0]:first[-1]]] = True
+            packed = np.packbits(batch, axis=1)
+            for k in range(len(first) - 1):
+                tx, ty = tiles[first[k]]
+                yield int(tx), int(ty), packed[k].tobytes()
+        return
+    bitmaps = {}
+    for x, y in cells:
+        key = (x >> shift, y >> shift)
+        bitmap = bitmaps.get(key)
+        if bitmap is None:
+            if not (-(1 << 31) <= key[0] < 1 << 31 and -(1 << 31) <= key[1] < 1 << 31):
+                raise outOfRange
+            bitmap = bitmaps[key] = bytearray(size * size // 8)
+        bit = (y & mask) * size + (x & mask)
+        bitmap[bit >> 3] |= 0x80 >> (bit & 7)
+    for (tx, ty) in sorted(bitmaps, key=lambda key: (key[1], key[0])):
+        yield tx, ty, bytes(bitmaps[(tx, ty)])
+
+def saveBinaryCells(filename, cells, compress=True, shift=BINARY_TILE_SHIFT):
+    index = []
+    # written next to the target and moved over it once complete, so a failed save
+    # never leaves a half-written file behind
+    try:
+        with open(filename + ".tmp", 'wb') as fd:
+            # payloads are streamed after a placeholder header, which is filled in at the end
+            fd.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, shift, 0, 0))
+            for tx, ty, bitmap in binaryTiles(cells, shift):
+                if compress:
+                    bitmap = zlib.compress(bitmap, BINARY_COMPRESSION_LEVEL)
+                index.append((tx, ty, fd.tell(), len(bitmap)))
+                fd.write(bitmap)
+            indexOffset = fd.tell()
+            for entry in index:
+                fd.write(BINARY_TILE.pack(*entry))
+            fd.seek(0)
+            fd.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_FLAG_ZLIB if compress else 0, shift, len(index), indexOffset))
+        os.replace(filename + ".tmp", filename)
+    except BaseException:
+        if os.path.exists(filename + ".tmp"):
+            os.remove(filename + ".tmp")
+        raise
+
+def loadBinaryCells(filename):
+    with open(filename, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size < BINARY_HEADER.size:
+            raise StateFileError(None, "truncated header")
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return list(iterBinaryCells(mm))
+
+def iterBinaryCells(mm):
+    for fraction, cells in iterBinaryTiles(mm):
+        yield from cells
+
+def iterBinaryTiles(mm):
+    # yields (fraction of the tiles read, cells of the tile) for every tile
+    magic, version, flags, shift, count, indexOffset = BINARY_HEADER.unpack_from(mm, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise StateFileError(None, "not a binary state file")
+    if indexOffset + count * BINARY_TILE.size > len(mm):
+        raise StateFileError(None, "truncated tile index")
+    size = 1 << shift
+    mask = size - 1
+    if HAVE_NUMPY:
+        loadNumpy()
+    for i in range(count):
+        tx, ty, offset, length = BINARY_TILE.unpack_from(mm, indexOffset + i * BINARY_TILE.size)
+        bitmap = mm[offset:offset + length]
+        if flags & BINARY_FLAG_ZLIB:
             try:
-                BrushMasks[BrushType[filename.split('.')[0]].value] = mask
-            except Exception as e:
-                print("loadBrushMasks:", e)
-
-def rotate(mat, left):
-    if left:
-        outer = range(len(mat[0]))
-        inner = range(len(mat)-1, -1, -1)
+                bitmap = zlib.decompress(bitmap)
+            except zlib.error as e:
+                raise StateFileError(None, f"tile {i}: {e}")
+        if len(bitmap) != size * size // 8:
+            raise StateFileError(None, f"tile {i} has the wrong size")
+        x0, y0 = tx << shift, ty << shift
+        if HAVE_NUMPY:
+            bits = np.flatnonzero(np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8)))
+            yield (i + 1) / count, list(zip((x0 + (bits & mask)).tolist(), (y0 + (bits >> shift)).tolist()))
+            continue
+        cells = []
+        for byte in range(len(bitmap)):
+            value = bitmap[byte]
+            if value:
+                for k in range(8):
+                    if value & (0x80 >> k):
+                        bit = byte * 8 + k
+                        cells.append((x0 + (bit & mask), y0 + (bit >> shift)))
+        yield (i + 1) / count, cells
+
+### Brushes ###
+# Brushes are compiled once into the offsets of their live cells from the clicked cell,
+# in all 8 ORIENTATIONS, and cached in BRUSH_CACHE_FILE so later runs need neither PIL
+# nor the pattern parsers. The cache is a BRUSH_CACHE_HEADER followed per brush by a
+# BRUSH_CACHE_ENTRY (path length, source mtime_ns and size, live cell count), the utf-8
+# path, then the int32 dx, dy pairs of each orientation in turn.
+BRUSH_CACHE_HEADER = struct.Struct("<4sBI")
+BRUSH_CACHE_ENTRY = struct.Struct("<HqqI")
+
+BrushCache = None # {path: (mtime_ns, size, offsets)}, read on first use
+
+def brushPath(brush):
+    return os.path.join(BRUSH_DIR, brush.name + ".png")
+
+def readBrushCache():
+    cache = {}
+    try:
+        with open(os.path.join(BRUSH_DIR, BRUSH_CACHE_FILE), 'rb') as fd:
+            data = fd.read()
+    except OSError:
+        return cache
+    try:
+        magic, version, count = BRUSH_CACHE_HEADER.unpack_from(data, 0)
+        if magic != BRUSH_CACHE_MAGIC or version != BRUSH_CACHE_VERSION:
+            return cache
+        pos = BRUSH_CACHE_HEADER.size
+        for i in range(count):
+            pathLength, mtime, size, population = BRUSH_CACHE_ENTRY.unpack_from(data, pos)
+            pos += BRUSH_CACHE_ENTRY.size
+            path = data[pos:pos + pathLength].decode()
+            pos += pathLength
+            offsets = array('i')
+            end = pos + offsets.itemsize * 2 * len(ORIENTATIONS) * population
+            offsets.frombytes(data[pos:end])
+            if len(offsets) != 2 * len(ORIENTATIONS) * population:
+                raise ValueError("truncated brush")
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            pos = end
+            cache[path] = (mtime, size, offsets)
+    except (struct.error, ValueError):
+        # a damaged cache is rebuilt from the sources
+        return {}
+    return cache
+
+def writeBrushCache():
+    # brushes whose source was deleted are dropped
+    entries = [(path, entry) for path, entry in BrushCache.items() if os.path.exists(path)]
+    parts = [BRUSH_CACHE_HEADER.pack(BRUSH_CACHE_MAGIC, BRUSH_CACHE_VERSION, len(entries))]
+    for path, (mtime, size, offsets) in entries:
+        encoded = path.encode()
+        parts.append(BRUSH_CACHE_ENTRY.pack(len(encoded), mtime, size, len(offsets) // (2 * len(ORIENTATIONS))))
+        parts.append(encoded)
+        if sys.byteorder == "big":
+            offsets = array('i', offsets)
+            offsets.byteswap()
+        parts.append(offsets.tobytes())
+    filename = os.path.join(BRUSH_DIR, BRUSH_CACHE_FILE)
+    try:
+        with open(filename + ".tmp", 'wb') as fd:
+            fd.write(b"".join(parts))
+        os.replace(filename + ".tmp", filename)
+    except OSError:
+        # a read-only install just compiles its brushes every run
+        pass
+
+def compileBrush(path):
+    # live cells of a PNG mask (black pixels) or of a pattern file, and the box they sit in
+    if os.path.splitext(path)[1].lower() == ".png":
+        from PIL import Image
+        with Image.open(path) as im:
+            width, height = im.size
+            pixels = im.convert("RGB").load()
+        cells = [(i, j) for i in range(width) for j in range(height) if pixels[i, j][0] == 0]
+        if not cells:
+            raise StateFileError(None, "the brush has no live cells")
     else:
-        outer = range(len(mat[0])-1, -1, -1)
-        inner = range(len(mat))
-    res = []
-    for i in outer:
-        inn_res = []
-        for j in inner:
-            inn_res.append(mat[j][i])
-        res.append(inn_res)
-    return res
+        cells = loadCells(path)
+        if not cells:
+            raise StateFileError(None, "the brush has no live cells")
+        minx = min(x for x, y in cells)
+        miny = min(y for x, y in cells)
+        cells = [(x - minx, y - miny) for x, y in cells]
+        width = max(x for x, y in cells) + 1
+        height = max(y for x, y in cells) + 1
+    offsets = array('i')
+    for xx, xy, yx, yy in ORIENTATIONS:
+        # offsets from the middle of the oriented box, like the unrotated mask is stamped
+        x0 = min(0, xx * (width - 1)) + min(0, xy * (height - 1))
+        y0 = min(0, yx * (width - 1)) + min(0, yy * (height - 1))
+        cx = x0 + (width if xx else height) // 2
+        cy = y0 + (height if yy else width) // 2
+        for x, y in cells:
+            offsets.append(xx*x + xy*y - cx)
+            offsets.append(yx*x + yy*y - cy)
+    return offsets
+
+def brushCache():
+    global BrushCache
+    if BrushCache is None:
+        BrushCache = readBrushCache()
+    return BrushCache
+
+def brushOrientations(path):
+    # [[(dx, dy), ...] for each of the 8 ORIENTATIONS], recompiled only when the source
+    # file changed since it was cached
+    cache = brushCache()
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    entry = cache.get(path)
+    if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+        entry = (stat.st_mtime_ns, stat.st_size, compileBrush(path))
+        cache[path] = entry
+        writeBrushCache()
+    offsets = entry[2]
+    step = len(offsets) // len(ORIENTATIONS)
+    return [list(zip(offsets[k:k + step:2], offsets[k + 1:k + step:2])) for k in range(0, len(offsets), step)]
+
+def importedBrushes():
+    # cached pattern files from outside BRUSH_DIR that still exist
+    return sorted(path for path in brushCache() if os.path.dirname(path) != BRUSH_DIR and os.path.exists(path))
+
+def randomSoup(width, height, density, seed=None):
+    import random
+
+    rng = random.Random(seed)
+    return [(i, j) for i in range(width) for j in range(height) if rng.random() < density]
+
+def parseRule(rule):
+    # Accepts "B36/S23" (in any case or order) and the older survival/birth form "23/36".
+    # Returns the sorted neighbour counts that give birth and that survive.
+    parts = rule.strip().upper().replace(" ", "").split("/")
+    if len(parts) != 2:
+        raise ValueError(f"Invalid rulestring: {rule}")
+    born = survive = None
+    for part in parts:
+        if part[:1] == "B":
+            born = part[1:]
+        elif part[:1] == "S":
+            survive = part[1:]
+    if born is None and survive is None:
+        survive, born = parts
+    if born is None or survive is None or any(c not in "012345678" for c in born + survive):
+        raise ValueError(f"Invalid rulestring: {rule}")
+    if "0" in born:
+        raise ValueError(f"Rules with birth on 0 neighbours are not supported: {rule}")
+    return tuple(sorted(set(map(int, born)))), tuple(sorted(set(map(int, survive))))
+
+def formatRule(born, survive):
+    return "B" + "".join(map(str, born)) + "/S" + "".join(map(str, survive))
+
+def thresholdRule(underpopulation, overpopulation, reborn):
+    # the rule of the three numbers in the rules popup: a cell only ever has 0-8 live
+    # neighbours, so survival is clipped to that range and a reborn count outside 1-8
+    # means no births (birth on 0 neighbours never happened on a sparse board)
+    born = [reborn] if 1 <= reborn <= 8 else []
+    return formatRule(born, range(max(underpopulation, 0), min(overpopulation, 8) + 1))
+
+def ruleTable(born, survive):
+    # entry count + 9*alive says whether a cell with count live neighbours lives on
+    return tuple([count in born for count in range(9)] + [count in survive for count in range(9)])
+
+def ruleRanges(counts):
+    # consecutive counts merged into (low, high) runs, for the vectorized engines
+    ranges = []
+    for count in counts:
+        if ranges and ranges[-1][1] == count - 1:
+            ranges[-1] = (ranges[-1][0], count)
+        else:
+            ranges.append((count, count))
+    return tuple(ranges)
 
 class GameState():
     def __init__(self):
         self.cells = []
         self.running = False
 
-        self.underpopulationRule = 2
-        self.overpopulationRule = 3
-        self.rebornRule = 3
+        self.setRule(DEFAULT_RULE)
+
+    def setRule(self, rule):
+        born, survive = parseRule(rule)
+        self.rule = formatRule(born, survive)
+        self.ruleTable = ruleTable(born, survive)
+        self.ruleRanges = (ruleRanges(born), ruleRanges(survive))
+
+    # The population is the set self.cellSet, so edits cost O(cells edited).
+    # self._cells is a lazily built list of it for callers that want a list.
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = list(self.cellSet)
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self.cellSet = set(cells)
+        self._cells = None
 
     def updateCells(self):
-        self.cells = list(set(self.cells)) # remove dups
-        next_gen_cells = []
-        self.dead_cells = []
-        self.new_cells = []
-        self.cell_dict = dict(zip(self.cells, [0]*len(self.cells)))
+        cells = self.cellSet
+        self.cell_dict = dict.fromkeys(cells, 0)
         self.potential_cells = {}
-        for cell in iter(self.cells):
+        for cell in cells:
             self.greetNeighbours(cell)
-        for cell in self.cell_dict.keys():
-            if self.generationStep(self.cell_dict[cell], alive=True):
-                next_gen_cells.append(cell)
-            else:
-                self.dead_cells.append(cell)
-        for cell in self.potential_cells.keys():
-            if self.generationStep(self.potential_cells[cell], alive=False):
-                next_gen_cells.append(cell)
-                self.new_cells.append(cell)
-        self.cells = next_gen_cells
+        born, survive = self.ruleTable[:9], self.ruleTable[9:]
+        self.dead_cells = [cell for cell, count in self.cell_dict.items() if not survive[count]]
+        self.new_cells = [cell for cell, count in self.potential_cells.items() if born[count]]
+        cells.difference_update(self.dead_cells)
+        cells.update(self.new_cells)
+        self._cells = None
 
     def greetNeighbours(self, cell):
         for i in range(cell[0]-1, cell[0]+2):
@@ -115,483 +665,1640 @@ class GameState():
                             self.potential_cells[(i, j)] = 1
 
     def generationStep(self, count, alive):
-        return (alive and count >= self.underpopulationRule and count <= self.overpopulationRule) or ((not alive) and count == self.rebornRule)
-
-class SavedState():
-    def __init__(self, cells):
-        self.cells = cells
-
-class Application(tk.Frame):
-    def __init__(self, master=None):
-        tk.Frame.__init__(self, master)
-        self.grid(padx=5, pady=5)
-
-        self.cellsize = 3
-        self.brushtype = BrushType.default
-        self.curBrushMask = None
-        self.brushsize = 1
-        self.brushrot = 0
-        self.cell_rectangles = {}
-        self.gamestate = GameState()
-        self.lastSavedState = None
-        self.undoStates = deque()
-
-        self.viewOffset = (0, 0)
-
-        self.update_freq_idx = 0
-        self.lastZoom = 0
-
-        self.showingRulesPopup = False
-
-        self.master.protocol("WM_DELETE_WINDOW", self.quit)
-        self.createWidgets()
-        self.drawGrid()
-
-    ### Update ###
-    def updateStep(self):
-        if len(self.undoStates) >= UNDO_HISTORY_LENGTH:
-            self.undoStates.popleft()
-        self.undoStates.append(SavedState(self.gamestate.cells))
-
-        self.gamestate.updateCells()
-        self.removeDeadCells()
-        self.addNewCells()
-
-    def updateLoop(self):
-        self.after(UPDATE_FREQS[self.update_freq_idx], self.updateLoop)
-        if self.gamestate.running:
-            self.updateStep()
-
-    ### Input ###
-    def leftClick(self, cell):
-        if self.brushtype == BrushType.default:
-            if self.brushsize == 1:
-                self.interfaceAddCell(cell)
+        return self.ruleTable[count + 9*alive]
+
+    def close(self):
+        pass
+
+    def addCell(self, cell):
+        return len(self.addCells([cell])) > 0
+
+    def removeCell(self, cell):
+        return len(self.removeCells([cell])) > 0
+
+    def addCells(self, cells):
+        # returns the cells that were not alive yet
+        cellSet = self.cellSet
+        added = []
+        for cell in cells:
+            if cell not in cellSet:
+                cellSet.add(cell)
+                added.append(cell)
+        if added:
+            self._cells = None
+        return added
+
+    def removeCells(self, cells):
+        # returns the cells that were alive
+        cellSet = self.cellSet
+        removed = []
+        for cell in cells:
+            if cell in cellSet:
+                cellSet.discard(cell)
+                removed.append(cell)
+        if removed:
+            self._cells = None
+        return removed
+
+def denseNeighbourCounts(board):
+    counts = np.zeros(board.shape, dtype=np.uint8)
+    counts[1:, :] += board[:-1, :]
+    counts[:-1, :] += board[1:, :]
+    counts[:, 1:] += board[:, :-1]
+    counts[:, :-1] += board[:, 1:]
+    counts[1:, 1:] += board[:-1, :-1]
+    counts[:-1, :-1] += board[1:, 1:]
+    counts[1:, :-1] += board[:-1, 1:]
+    counts[:-1, 1:] += board[1:, :-1]
+    return counts
+
+def denseCountMask(counts, ranges):
+    # comparisons against each run of counts beat a fancy-indexed table lookup
+    mask = None
+    for low, high in ranges:
+        part = counts == low if low == high else (counts >= low) & (counts <= high)
+        mask = part if mask is None else mask | part
+    return mask if mask is not None else np.zeros(counts.shape, dtype=bool)
+
+def denseNextBoard(board, counts, ranges):
+    born, survive = ranges
+    return (board & denseCountMask(counts, survive)) | (~board & denseCountMask(counts, born))
+
+class DenseGameState(GameState):
+    # Keeps the live region as a boolean numpy array and steps it with vectorized
+    # neighbour sums. The array is re-fitted around the population as it grows/shrinks.
+    def __init__(self):
+        loadNumpy()
+        self.board = None
+        self.origin = (0, 0)
+        self.stepsSinceFit = 0
+        GameState.__init__(self)
+        self.new_cells = []
+        self.dead_cells = []
+
+    # While self.board is None the population is GameState's cellSet, otherwise
+    # self._cells is a lazily built cache of the board.
+    @property
+    def cells(self):
+        if self.board is None:
+            return GameState.cells.fget(self)
+        if self._cells is None:
+            self._cells = self.boardCells(self.board)
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        GameState.cells.fset(self, cells)
+        self.board = None
+
+    def addCells(self, cells):
+        if self.board is None:
+            return GameState.addCells(self, cells)
+        board = self.board
+        w, h = board.shape
+        ox, oy = self.origin
+        added = []
+        outside = []
+        for cell in cells:
+            x, y = cell[0] - ox, cell[1] - oy
+            if 0 <= x < w and 0 <= y < h:
+                if not board[x, y]:
+                    board[x, y] = True
+                    added.append(cell)
             else:
-                halfbs = math.ceil(self.brushsize / 2)
-                for i in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
-                    for j in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
-                        self.interfaceAddCell((cell[0] + i, cell[1] + j))
+                outside.append(cell)
+        self._cells = None
+        if outside:
+            # the set has no edges, the next step fits a new board around everything
+            self.cells = self.cells
+            added += GameState.addCells(self, outside)
+        return added
+
+    def removeCells(self, cells):
+        if self.board is None:
+            return GameState.removeCells(self, cells)
+        board = self.board
+        w, h = board.shape
+        ox, oy = self.origin
+        removed = []
+        for cell in cells:
+            x, y = cell[0] - ox, cell[1] - oy
+            if 0 <= x < w and 0 <= y < h and board[x, y]:
+                board[x, y] = False
+                removed.append(cell)
+        self._cells = None
+        return removed
+
+    def boardCells(self, board):
+        xs, ys = np.nonzero(board)
+        return list(zip((xs + self.origin[0]).tolist(), (ys + self.origin[1]).tolist()))
+
+    def loadBoard(self):
+        self.stepsSinceFit = 0
+        if len(self.cellSet) == 0:
+            self.origin = (0, 0)
+            self.board = np.zeros((2*DENSE_MARGIN, 2*DENSE_MARGIN), dtype=bool)
+            return
+        coords = np.array(list(self.cellSet), dtype=np.int64).reshape(-1, 2)
+        low = coords.min(axis=0)
+        high = coords.max(axis=0)
+        self.origin = (int(low[0]) - DENSE_MARGIN, int(low[1]) - DENSE_MARGIN)
+        self.board = np.zeros((int(high[0] - low[0]) + 1 + 2*DENSE_MARGIN, int(high[1] - low[1]) + 1 + 2*DENSE_MARGIN), dtype=bool)
+        self.board[coords[:, 0] - self.origin[0], coords[:, 1] - self.origin[1]] = True
+
+    def fitBoard(self):
+        # Live cells must stay off the outermost ring so births always land inside the array.
+        board = self.board
+        touching = board[0].any() or board[-1].any() or board[:, 0].any() or board[:, -1].any()
+        self.stepsSinceFit += 1
+        if not touching and self.stepsSinceFit < DENSE_FIT_INTERVAL:
+            return
+        self.stepsSinceFit = 0
+        xs = np.flatnonzero(board.any(axis=1))
+        ys = np.flatnonzero(board.any(axis=0))
+        if len(xs) == 0:
+            if board.shape != (2*DENSE_MARGIN, 2*DENSE_MARGIN):
+                self.board = np.zeros((2*DENSE_MARGIN, 2*DENSE_MARGIN), dtype=bool)
+            return
+        x0, x1, y0, y1 = int(xs[0]), int(xs[-1]) + 1, int(ys[0]), int(ys[-1]) + 1
+        w, h = x1 - x0, y1 - y0
+        # margins grow with the pattern so that expanding patterns re-fit rarely
+        mx = DENSE_MARGIN + w // 4
+        my = DENSE_MARGIN + h // 4
+        if not touching and board.shape[0] <= w + 4*mx and board.shape[1] <= h + 4*my:
+            return
+        fitted = np.zeros((w + 2*mx, h + 2*my), dtype=bool)
+        fitted[mx:mx + w, my:my + h] = board[x0:x1, y0:y1]
+        self.origin = (self.origin[0] + x0 - mx, self.origin[1] + y0 - my)
+        self.board = fitted
+
+    def updateCells(self):
+        if self.board is None:
+            self.loadBoard()
+        self.fitBoard()
+        board = self.board
+        nextboard = denseNextBoard(board, denseNeighbourCounts(board), self.ruleRanges)
+        self.new_cells = self.boardCells(nextboard & ~board)
+        self.dead_cells = self.boardCells(board & ~nextboard)
+        self.board = nextboard
+        self._cells = None
+
+class AdaptiveGameState(DenseGameState):
+    # Runs the sparse dict engine for thin populations and the dense engine once
+    # the population fills enough of its bounding box.
+    def __init__(self):
+        self.dense = False
+        self.stepsSinceDensityCheck = DENSITY_CHECK_INTERVAL
+        DenseGameState.__init__(self)
+
+    # a new population may be spread far wider than the board the old one filled, so
+    # it is held as a set until the next step has checked its density
+    @DenseGameState.cells.setter
+    def cells(self, cells):
+        DenseGameState.cells.fset(self, cells)
+        self.dense = False
+        self.stepsSinceDensityCheck = DENSITY_CHECK_INTERVAL
+
+    def populationArea(self):
+        # live cells and the area of their bounding box
+        if self.board is not None:
+            population = int(np.count_nonzero(self.board))
+            if population == 0:
+                return population, 0
+            xs = np.flatnonzero(self.board.any(axis=1))
+            ys = np.flatnonzero(self.board.any(axis=0))
+            return population, (int(xs[-1] - xs[0]) + 1) * (int(ys[-1] - ys[0]) + 1)
+        cells = self.cellSet
+        population = len(cells)
+        if population == 0:
+            return population, 0
+        xs = [cell[0] for cell in cells]
+        ys = [cell[1] for cell in cells]
+        return population, (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1)
+
+    def chooseEngine(self):
+        self.stepsSinceDensityCheck += 1
+        if self.stepsSinceDensityCheck < DENSITY_CHECK_INTERVAL:
+            return
+        self.stepsSinceDensityCheck = 0
+        population, area = self.populationArea()
+        if not self.dense and population >= DENSE_MIN_POPULATION and population >= DENSE_ENTER_DENSITY * area and area <= DENSE_MAX_AREA:
+            self.dense = True
+        elif self.dense and (population < DENSE_MIN_POPULATION or population < DENSE_LEAVE_DENSITY * area or area > DENSE_MAX_AREA):
+            self.cells = self.cells # hand the population back to the list
+            self.stepsSinceDensityCheck = 0
+
+    def updateCells(self):
+        self.chooseEngine()
+        if self.dense:
+            DenseGameState.updateCells(self)
         else:
-            halfwidth = int(len(self.curBrushMask) / 2)
-            halfheight = int(len(self.curBrushMask[0]) / 2)
-            for i in range(len(self.curBrushMask)):
-                for j in range(len(self.curBrushMask[0])):
-                    if self.curBrushMask[i][j]:
-                        self.interfaceAddCell((cell[0] + i - halfwidth, cell[1] + j - halfheight))
-
-    def leftClickedCanvasCallback(self, event):
-        i = math.floor(event.x / self.cellsize) - self.viewOffset[0]
-        j = math.floor(event.y / self.cellsize) - self.viewOffset[1]
-        self.leftClick((i, j))
-
-    def deleteCell(self, cell):
-        try:
-            self.gamestate.cells.remove(cell)
-        except ValueError:
-            pass
-        try:
-            self.canvas.delete(self.cell_rectangles[cell])
-            del self.cell_rectangles[cell]
-        except KeyError:
-            pass
+            GameState.updateCells(self)
+
+def packCells(cells):
+    # (x, y) pairs -> int64 keys (x + PACKED_BIAS) << 32 | (y + PACKED_BIAS); the key of
+    # a neighbour is the key plus dx << 32 plus dy, as y + PACKED_BIAS never carries
+    coords = np.array(cells, dtype=np.int64).reshape(-1, 2)
+    if len(coords) and (coords.min() < -PACKED_BIAS or coords.max() >= PACKED_BIAS):
+        raise ValueError(f"The packed engine only holds coordinates in [{-PACKED_BIAS}, {PACKED_BIAS})")
+    return ((coords[:, 0] + PACKED_BIAS) << 32) | (coords[:, 1] + PACKED_BIAS)
+
+def unpackCells(keys):
+    xs = (keys >> 32) - PACKED_BIAS
+    ys = (keys & 0xFFFFFFFF) - PACKED_BIAS
+    return list(zip(xs.tolist(), ys.tolist()))
+
+class PackedGameState(GameState):
+    # Keeps the population as a sorted numpy array of packed int64 coordinates and
+    # counts neighbours by sorting the 8 shifted copies of it, so a generation makes a
+    # handful of arrays instead of a tuple per neighbour. (x, y) tuples are only built
+    # when cells, new_cells or dead_cells are read.
+    def __init__(self):
+        loadNumpy()
+        self.neighbourOffsets = np.array([(dx << 32) + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy], dtype=np.int64)
+        GameState.__init__(self)
+        self.newKeys = self.keys[:0]
+        self.deadKeys = self.keys[:0]
+        self._changes = None
+
+    def setRule(self, rule):
+        GameState.setRule(self, rule)
+        self.bornTable = np.array(self.ruleTable[:9])
+        self.surviveTable = np.array(self.ruleTable[9:])
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = unpackCells(self.keys)
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self.keys = np.unique(packCells(list(cells)))
+        self._cells = None
+
+    # the changes of the last generation are unpacked together the first time either is read
+    @property
+    def new_cells(self):
+        if self._changes is None:
+            self._changes = (unpackCells(self.newKeys), unpackCells(self.deadKeys))
+        return self._changes[0]
+
+    @property
+    def dead_cells(self):
+        if self._changes is None:
+            self._changes = (unpackCells(self.newKeys), unpackCells(self.deadKeys))
+        return self._changes[1]
+
+    def find(self, packed):
+        # positions of packed in self.keys, and which of them are alive
+        keys = self.keys
+        index = np.searchsorted(keys, packed)
+        if len(keys) == 0:
+            return index, np.zeros(len(packed), dtype=bool)
+        np.minimum(index, len(keys) - 1, out=index)
+        return index, keys[index] == packed
 
-    def rightClick(self, cell):
-        if self.brushsize == 1:
-            self.deleteCell(cell)
+    def updateCells(self):
+        keys = self.keys
+        candidates, counts = np.unique((keys[None, :] + self.neighbourOffsets[:, None]).ravel(), return_counts=True)
+        index, alive = self.find(candidates)
+        born = ~alive & self.bornTable[counts]
+        survive = alive & self.surviveTable[counts]
+        self.newKeys = candidates[born]
+        died = candidates[alive & ~survive]
+        nextKeys = candidates[born | survive]
+        # live cells without live neighbours are not among the candidates
+        lonely = np.ones(len(keys), dtype=bool)
+        lonely[index[alive]] = False
+        if self.surviveTable[0]:
+            nextKeys = np.sort(np.concatenate((nextKeys, keys[lonely])))
         else:
-            halfbs = math.ceil(self.brushsize / 2)
-            for i in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
-                for j in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
-                    self.deleteCell((cell[0] + i, cell[1] + j))
-
-    def rightClickedCanvasCallback(self, event):
-        i = math.floor(event.x / self.cellsize) - self.viewOffset[0]
-        j = math.floor(event.y / self.cellsize) - self.viewOffset[1]
-        cell = (i, j)
-        self.rightClick(cell)
-
-    def zoomLocation(self, event):
-        cx = int(self.canvas.winfo_width()  / 2)
-        cy = int(self.canvas.winfo_height() / 2)
-        self.viewOffset = (int((cx - event.x) / self.cellsize + self.viewOffset[0]), int((cy - event.y) / self.cellsize) + self.viewOffset[1])
-
-    def zoomIn(self, event):
-        now = time()
-        if self.cellsize >= MAX_CELLSIZE or now - self.lastZoom < ZOOM_FREQ: return
-        self.lastZoom = now
-        self.cellsize += 1
-        self.zoomLocation(event)
-        self.refreshView()
-
-    def zoomOut(self, event):
-        now = time()
-        if self.cellsize <= 2 or now - self.lastZoom < ZOOM_FREQ: return
-        self.lastZoom = now
-        self.cellsize -= 1
-        self.zoomLocation(event)
-        self.refreshView()
-
-    def handleKey(self, event):
-        if   event.keycode in [111, 25]: # Up
-            self.viewOffset = (self.viewOffset[0], self.viewOffset[1] + 1)
-        elif event.keycode in [113, 38]: # Left
-            self.viewOffset = (self.viewOffset[0] + 1, self.viewOffset[1])
-        elif event.keycode in [114, 40]: # Right
-            self.viewOffset = (self.viewOffset[0] - 1, self.viewOffset[1])
-        elif event.keycode in [116, 39]: # Down
-            self.viewOffset = (self.viewOffset[0], self.viewOffset[1] - 1)
+            died = np.concatenate((died, keys[lonely]))
+        self.deadKeys = died
+        self.keys = nextKeys
+        self._cells = None
+        self._changes = None
+
+    def addCells(self, cells):
+        cells = list(cells)
+        if not cells:
+            return []
+        packed = packCells(cells)
+        # first occurrence of each cell, in the order given
+        first = np.sort(np.unique(packed, return_index=True)[1])
+        fresh = first[~self.find(packed[first])[1]]
+        if len(fresh):
+            self.keys = np.sort(np.concatenate((self.keys, packed[fresh])))
+            self._cells = None
+        return [cells[i] for i in fresh.tolist()]
+
+    def removeCells(self, cells):
+        cells = list(cells)
+        if not cells:
+            return []
+        packed = packCells(cells)
+        first = np.sort(np.unique(packed, return_index=True)[1])
+        index, alive = self.find(packed[first])
+        if alive.any():
+            keep = np.ones(len(self.keys), dtype=bool)
+            keep[index[alive]] = False
+            self.keys = self.keys[keep]
+            self._cells = None
+        return [cells[i] for i in first[alive].tolist()]
+
+def rowBits(row):
+    # indices of the set bits of row, lowest first
+    return [i for i, bit in enumerate(reversed(bin(row))) if bit == "1"]
+
+class RowGameState(GameState):
+    # Keeps every live row as one Python int whose bit i is the cell at x = originX + i,
+    # and steps a whole row at once: each row's horizontal neighbour sums are 2-bit
+    # numbers kept in two ints, and the row above, the row itself and the row below
+    # are added with bitwise full adders into the 4 bits of every cell's count.
+    # Needs no numpy, and the cost grows with the width of the rows, not the population.
+    def __init__(self):
+        GameState.__init__(self)
+        self.new_cells = []
+        self.dead_cells = []
+
+    def setRule(self, rule):
+        GameState.setRule(self, rule)
+        self.bornCounts = [count for count in range(9) if self.ruleTable[count]]
+        self.surviveCounts = [count for count in range(9) if self.ruleTable[9 + count]]
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            ox = self.originX
+            self._cells = [(ox + i, y) for y, row in self.rows.items() for i in rowBits(row)]
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self.rows = {}
+        self._cells = None
+        cells = list(cells)
+        if not cells:
+            self.originX = 0
+            return
+        xsByRow, minx = cellRows(cells)
+        self.originX = ox = minx - ROW_MARGIN
+        for y, xs in xsByRow.items():
+            row = bytearray(((xs[-1] - ox) >> 3) + 1)
+            for x in xs:
+                row[(x - ox) >> 3] |= 1 << ((x - ox) & 7)
+            self.rows[y] = int.from_bytes(row, "little")
+
+    def shiftRows(self, shift):
+        # moves originX left by shift (right for a negative shift), keeping the cells in place
+        if shift > 0:
+            self.rows = {y: row << shift for y, row in self.rows.items()}
+        elif shift < 0:
+            self.rows = {y: row >> -shift for y, row in self.rows.items()}
+        self.originX -= shift
+
+    def fitRows(self):
+        # bit 0 must stay empty so that no neighbour falls off the low end of a row,
+        # and the free bits below the live region are trimmed once it moves away
+        if not self.rows:
+            return
+        low = min((row & -row).bit_length() for row in self.rows.values()) - 1
+        if low < 1 or low > 2 * ROW_MARGIN:
+            self.shiftRows(ROW_MARGIN - low)
+
+    def countMask(self, bits, count):
+        # bits where the neighbour count, given as its 4 bit planes, equals count
+        b0, b1, b2, b3 = bits
+        mask = b0 if count & 1 else ~b0
+        mask &= b1 if count & 2 else ~b1
+        mask &= b2 if count & 4 else ~b2
+        # 8 is the only count with b3 set, and the only one sharing its low bits with 0
+        if count == 0:
+            mask &= ~b3
+        elif count == 8:
+            mask = b3
+        return mask
+
+    def updateCells(self):
+        self.fitRows()
+        rows = self.rows
+        # per live row: the 2-bit sum of its left and right neighbours, and of all three
+        pairs = {}
+        triples = {}
+        for y, row in rows.items():
+            left, right = row << 1, row >> 1
+            p0, p1 = left ^ right, left & right
+            pairs[y] = (p0, p1)
+            triples[y] = (p0 ^ row, p1 | (p0 & row))
+        none = (0, 0)
+        candidates = set(rows)
+        candidates.update([y - 1 for y in rows])
+        candidates.update([y + 1 for y in rows])
+        bornCounts, surviveCounts = self.bornCounts, self.surviveCounts
+        countMask = self.countMask
+        nextRows = {}
+        self.new_cells = new_cells = []
+        self.dead_cells = dead_cells = []
+        ox = self.originX
+        for y in candidates:
+            a0, a1 = triples.get(y - 1, none)
+            c0, c1 = triples.get(y + 1, none)
+            p0, p1 = pairs.get(y, none)
+            # above + below: two 2-bit numbers into three bits
+            s0 = a0 ^ c0
+            carry = a0 & c0
+            s1 = a1 ^ c1 ^ carry
+            s2 = (a1 & c1) | (carry & (a1 ^ c1))
+            # + left and right of the row itself: into the four bits of the count
+            carry = s0 & p0
+            bits = [s0 ^ p0, s1 ^ p1 ^ carry]
+            carry = (s1 & p1) | (carry & (s1 ^ p1))
+            bits.append(s2 ^ carry)
+            bits.append(s2 & carry)
+            row = rows.get(y, 0)
+            born = 0
+            for count in bornCounts:
+                born |= countMask(bits, count)
+            born &= ~row
+            survive = 0
+            if row:
+                for count in surviveCounts:
+                    survive |= countMask(bits, count)
+                survive &= row
+            nextRow = born | survive
+            if nextRow:
+                nextRows[y] = nextRow
+            if born:
+                new_cells.extend([(ox + i, y) for i in rowBits(born)])
+            died = row & ~survive
+            if died:
+                dead_cells.extend([(ox + i, y) for i in rowBits(died)])
+        self.rows = nextRows
+        self._cells = None
+
+    def addCells(self, cells):
+        cells = list(cells)
+        if not cells:
+            return []
+        minx = min(cell[0] for cell in cells)
+        if not self.rows:
+            self.originX = minx - ROW_MARGIN
+        elif minx - self.originX < 1:
+            self.shiftRows(self.originX - minx + ROW_MARGIN)
+        rows = self.rows
+        ox = self.originX
+        added = []
+        for cell in cells:
+            bit = 1 << (cell[0] - ox)
+            row = rows.get(cell[1], 0)
+            if not row & bit:
+                rows[cell[1]] = row | bit
+                added.append(cell)
+        if added:
+            self._cells = None
+        return added
+
+    def removeCells(self, cells):
+        rows = self.rows
+        ox = self.originX
+        removed = []
+        for cell in cells:
+            i = cell[0] - ox
+            row = rows.get(cell[1], 0)
+            if i >= 0 and row >> i & 1:
+                row &= ~(1 << i)
+                if row:
+                    rows[cell[1]] = row
+                else:
+                    del rows[cell[1]]
+                removed.append(cell)
+        if removed:
+            self._cells = None
+        return removed
+
+class HashLifeNode():
+    __slots__ = ('k', 'a', 'b', 'c', 'd', 'n', '__weakref__')
+
+    # a, b, c, d are the nw, ne, sw and se quadrants (x grows east, y grows south)
+    def __init__(self, k, a, b, c, d, n):
+        self.k = k
+        self.a = a
+        self.b = b
+        self.c = c
+        self.d = d
+        self.n = n
+
+class HashLifeGameState(GameState):
+    # Memoized quadtree engine. Nodes are canonicalized so identical sub-patterns are
+    # shared, and successors are cached per (node, step exponent), which lets repetitive
+    # patterns advance 2^j generations at a time.
+    def __init__(self, maxNodes=HASHLIFE_MAX_NODES):
+        self.maxNodes = maxNodes
+        self.off = HashLifeNode(0, None, None, None, None, 0)
+        self.on = HashLifeNode(0, None, None, None, None, 1)
+        self.nodes = {}
+        self.stepCache = {}
+        self.empties = [self.off]
+        self.cacheRule = None
+        self.root = None
+        self.origin = (0, 0)
+        self.generation = 0
+        self.stepSize = 1
+        self.evictions = 0
+        GameState.__init__(self)
+        self.new_cells = []
+        self.dead_cells = []
+
+    # While self.root is None the population is GameState's cellSet, otherwise
+    # self._cells is a lazily built cache of the tree.
+    @property
+    def cells(self):
+        if self.root is None:
+            return GameState.cells.fget(self)
+        if self._cells is None:
+            self._cells = []
+            self.treeCells(self.root, self.origin[0], self.origin[1], self._cells)
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        GameState.cells.fset(self, cells)
+        self.root = None
+
+    # Edits rebuild only the nodes on the path to each cell
+    def addCells(self, cells):
+        if self.root is None:
+            return GameState.addCells(self, cells)
+        added = []
+        for cell in cells:
+            root = self.root
+            while not (0 <= cell[0] - self.origin[0] < 1 << root.k and 0 <= cell[1] - self.origin[1] < 1 << root.k):
+                half = 1 << (root.k - 1)
+                self.origin = (self.origin[0] - half, self.origin[1] - half)
+                root = self.root = self.centre(root)
+            x, y = cell[0] - self.origin[0], cell[1] - self.origin[1]
+            if not self.treeCell(root, x, y):
+                self.root = self.setTreeCell(root, x, y, self.on)
+                added.append(cell)
+        self._cells = None
+        return added
+
+    def removeCells(self, cells):
+        if self.root is None:
+            return GameState.removeCells(self, cells)
+        removed = []
+        size = 1 << self.root.k
+        for cell in cells:
+            x, y = cell[0] - self.origin[0], cell[1] - self.origin[1]
+            if 0 <= x < size and 0 <= y < size and self.treeCell(self.root, x, y):
+                self.root = self.setTreeCell(self.root, x, y, self.off)
+                removed.append(cell)
+        self._cells = None
+        return removed
+
+    def treeCell(self, node, x, y):
+        while node.k > 0 and node.n:
+            half = 1 << (node.k - 1)
+            if y < half:
+                node = node.a if x < half else node.b
+            else:
+                node = node.c if x < half else node.d
+            x &= half - 1
+            y &= half - 1
+        return node.n > 0
+
+    def setTreeCell(self, node, x, y, leaf):
+        if node.k == 0:
+            return leaf
+        half = 1 << (node.k - 1)
+        a, b, c, d = node.a, node.b, node.c, node.d
+        if y < half:
+            if x < half:
+                a = self.setTreeCell(a, x, y, leaf)
+            else:
+                b = self.setTreeCell(b, x - half, y, leaf)
+        elif x < half:
+            c = self.setTreeCell(c, x, y - half, leaf)
         else:
-            #print(event.keycode)
+            d = self.setTreeCell(d, x - half, y - half, leaf)
+        return self.join(a, b, c, d)
+
+    ### Nodes ###
+    def join(self, a, b, c, d):
+        key = (a, b, c, d)
+        node = self.nodes.get(key)
+        if node is None:
+            node = HashLifeNode(a.k + 1, a, b, c, d, a.n + b.n + c.n + d.n)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, k):
+        while len(self.empties) <= k:
+            e = self.empties[-1]
+            self.empties.append(self.join(e, e, e, e))
+        return self.empties[k]
+
+    def centre(self, m):
+        z = self.empty(m.k - 1)
+        return self.join(self.join(z, z, z, m.a), self.join(z, z, m.b, z), self.join(z, m.c, z, z), self.join(m.d, z, z, z))
+
+    def buildTree(self, k, x, y, cells):
+        if not cells:
+            return self.empty(k)
+        if k == 0:
+            return self.on
+        half = 1 << (k - 1)
+        quads = ([], [], [], [])
+        for cell in cells:
+            quads[(cell[0] >= x + half) + 2*(cell[1] >= y + half)].append(cell)
+        return self.join(self.buildTree(k - 1, x, y, quads[0]),
+                         self.buildTree(k - 1, x + half, y, quads[1]),
+                         self.buildTree(k - 1, x, y + half, quads[2]),
+                         self.buildTree(k - 1, x + half, y + half, quads[3]))
+
+    def loadTree(self):
+        cells = list(self.cellSet)
+        if not cells:
+            self.origin = (0, 0)
+            self.root = self.empty(3)
             return
-        self.refreshView(drawGrid=False)
-
-    def toggleGameUpdates(self):
-            self.gamestate.running = not self.gamestate.running
-
-    def saveState(self):
-        self.lastSavedState = SavedState(self.gamestate.cells)
-
-    def saveStateToFile(self):
-        filename = filedialog.asksaveasfilename(initialdir=__file__, title="Select state file", filetypes=(("text", "*.txt"), ("all files", "*.*")))
-        if filename:
-            with open(filename, 'w') as fd:
-                for cell in self.gamestate.cells:
-                    fd.write(f"{cell[0]},{cell[1]}\n")
-
-    def loadStateFromFile(self):
-        filename = filedialog.askopenfilename(initialdir=__file__, title="Select state file", filetypes=(("text", "*.txt"), ("all files", "*.*")))
-        if filename:
-            linecount = 0
-            newcells = []
-            lowestCoords = None
-            with open(filename, 'r') as fd:
-                try:
-                    for line in fd:
-                        linecount += 1
-                        cell_parts = line.split(',')
-                        if len(cell_parts) != 2:
-                            raise ValueError
-                        cell = (int(cell_parts[0]), int(cell_parts[1]))
-                        if lowestCoords:
-                            lowestCoords = (min(lowestCoords[0], cell[0]), min(lowestCoords[1], cell[1]))
-                        else:
-                            lowestCoords = cell
-                        newcells.append(cell)
-                except ValueError:
-                    showerror(title="Load error", message="Error loading state save file on line %d" % linecount)
-                    return
-            self.viewOffset = (-lowestCoords[0], -lowestCoords[1])
-            self.gamestate.cells = newcells
-            self.refreshView()
-
-    def loadState(self):
-        if self.lastSavedState:
-            self.gamestate.cells = self.lastSavedState.cells
-            self.refreshView()
-
-    def clearState(self):
-        self.gamestate.cells = []
-        self.refreshView()
-
-    def manualStep(self):
-        self.updateStep()
-
-    def manualStepBack(self):
-        if len(self.undoStates) > 0:
-            self.gamestate.cells = self.undoStates.pop().cells
-            self.refreshView()
-
-    def updateSpeedLabel(self):
-        self.speedStringVar.set(f"Speed: x{self.update_freq_idx + 1}")
-
-    def increaseSpeed(self):
-        if self.update_freq_idx >= len(UPDATE_FREQS)-1: return
-        self.update_freq_idx += 1
-        self.updateSpeedLabel()
-
-    def decreaseSpeed(self):
-        if self.update_freq_idx <= 0: return
-        self.update_freq_idx -= 1
-        self.updateSpeedLabel()
-
-    def updateBrushSizeLabel(self):
-        self.brushSizeVar.set(f"Brush size: {self.brushsize}")
-
-    def increaseBrushSize(self):
-        if self.brushsize >= 9: return
-        self.brushsize += 1
-        self.updateBrushSizeLabel()
-
-    def decreaseBrushSize(self):
-        if self.brushsize <= 1: return
-        self.brushsize -= 1
-        self.updateBrushSizeLabel()
-
-    def updateBrushRotLabel(self):
-        self.brushRotVar.set(f"Brush rotation: {self.brushrot}")
-
-    def rotateBrushLeft(self):
-        if self.curBrushMask == None: return
-        self.brushrot -= 90
-        if self.brushrot < 0:
-            self.brushrot = 270
-        self.curBrushMask = rotate(self.curBrushMask, True)
-        self.updateBrushRotLabel()
-
-    def rotateBrushRight(self):
-        if self.curBrushMask == None: return
-        self.brushrot += 90
-        if self.brushrot >= 360:
-            self.brushrot = 0
-        self.curBrushMask = rotate(self.curBrushMask, False)
-        self.updateBrushRotLabel()
-
-    def selectBrush(self, brush):
-        self.brushtype = brush
-        self.brushrot = 0
-        self.updateBrushRotLabel()
-        self.curBrushMask = BrushMasks[self.brushtype.value]
-
-    def updateRules(self):
-        self.gamestate.underpopulationRule = int(self.underpopulationStringVar.get())
-        self.gamestate.overpopulationRule = int(self.overpopulationStringVar.get())
-        self.gamestate.rebornRule = int(self.rebornStringVar.get())
-
-    def quitRulesPopup(self):
-        self.showingRulesPopup = False
-        self.rulesPopup.destroy()
-
-    def setAutomataRulesPopup(self):
-        if self.showingRulesPopup: return
-        self.showingRulesPopup = True
-        self.rulesPopup = tk.Toplevel(padx=10, pady=10)
-        self.rulesPopup.attributes('-topmost', 'true')
-        self.rulesPopup.protocol("WM_DELETE_WINDOW", self.quitRulesPopup)
-
-        header = tk.Label(self.rulesPopup, text="These are the rules of life:", font='Helvetica 14 bold')
-        header.grid(row=0, column=0, sticky="W")
-
-        rulesMainFrame = tk.Frame(self.rulesPopup)
-        rulesMainFrame.grid(row=1, column=0, pady=5)
-        label1 = tk.Label(rulesMainFrame, text="A live cell dies by underpopulation when it has fewer than")
-        label1.grid(row=0, column=0, sticky="E")
-        self.underpopulationStringVar = tk.StringVar()
-        self.underpopulationStringVar.set(str(self.gamestate.underpopulationRule))
-        underpopulationEntry = tk.Entry(rulesMainFrame, textvariable=self.underpopulationStringVar, justify=tk.CENTER, width=10)
-        underpopulationEntry.grid(row=0, column=1, padx=5)
-        label2 = tk.Label(rulesMainFrame, text="neighbours.")
-        label2.grid(row=0, column=2)
-
-        label1 = tk.Label(rulesMainFrame, text="A live cell dies by overpopulation when it has more than")
-        label1.grid(row=1, column=0, sticky="E")
-        self.overpopulationStringVar = tk.StringVar()
-        self.overpopulationStringVar.set(str(self.gamestate.overpopulationRule))
-        overpopulationEntry = tk.Entry(rulesMainFrame, textvariable=self.overpopulationStringVar, justify=tk.CENTER, width=10)
-        overpopulationEntry.grid(row=1, column=1, padx=5)
-        label2 = tk.Label(rulesMainFrame, text="neighbours.")
-        label2.grid(row=1, column=2)
-
-        label1 = tk.Label(rulesMainFrame, text="A dead cell is reborn when it has exactly ")
-        label1.grid(row=2, column=0, sticky="E")
-        self.rebornStringVar = tk.StringVar()
-        self.rebornStringVar.set(str(self.gamestate.rebornRule))
-        rebornEntry = tk.Entry(rulesMainFrame, textvariable=self.rebornStringVar, justify=tk.CENTER, width=10)
-        rebornEntry.grid(row=2, column=1, padx=5)
-        label2 = tk.Label(rulesMainFrame, text="neighbours.")
-        label2.grid(row=2, column=2)
-
-        updateRulesButton = tk.Button(self.rulesPopup, text='Update rules', command=self.updateRules, width=10)
-        updateRulesButton.grid(row=2, column=0, sticky="E")
-
-    ### Init ###
-    def createTopFrame(self):
-        quitButton = tk.Button(self, text='Quit', command=self.quit, width=10)
-        quitButton.grid(row=0, column=0, sticky="NW")
-
-        setRulesButton = tk.Button(self, text='Rules of life', command=self.setAutomataRulesPopup, width=10)
-        setRulesButton.grid(row=0, column=1, sticky="N")
-
-        gameControlFrame = tk.Frame(self)
-        gameControlFrame.grid(row=0, column=2, sticky="NE")
-        startButton = tk.Button(gameControlFrame, text='Start/Pause', command=self.toggleGameUpdates, width=10)
-        startButton.grid(row=0, column=0)
-        stepButton = tk.Button(gameControlFrame, text='Step', command=self.manualStep, width=10)
-        stepButton.grid(row=0, column=1)
-        stepBackButton = tk.Button(gameControlFrame, text='Step back', command=self.manualStepBack, width=10)
-        stepBackButton.grid(row=0, column=2)
-        self.speedStringVar = tk.StringVar()
-        self.updateSpeedLabel()
-        speedLabel = tk.Label(gameControlFrame, textvariable=self.speedStringVar)
-        speedLabel.grid(row=1, column=0)
-        speedDecreaseButton = tk.Button(gameControlFrame, text='Slower', command=self.decreaseSpeed, width=10)
-        speedDecreaseButton.grid(row=1, column=1)
-        speedIncreaseButton = tk.Button(gameControlFrame, text='Faster', command=self.increaseSpeed, width=10)
-        speedIncreaseButton.grid(row=1, column=2)
-
-        stateControlFrame = tk.Frame(self)
-        stateControlFrame.grid(row=0, column=3, sticky="E")
-        saveButton = tk.Button(stateControlFrame, text='Quicksave', command=self.saveState, width=10)
-        saveButton.grid(row=0, column=0)
-        loadButton = tk.Button(stateControlFrame, text='Load quicksave', command=self.loadState, width=10)
-        loadButton.grid(row=0, column=1)
-        clearButton = tk.Button(stateControlFrame, text='Clear state', command=self.clearState, width=10)
-        clearButton.grid(row=0, column=2)
-        saveToFileButton = tk.Button(stateControlFrame, text='Save to file', command=self.saveStateToFile, width=10)
-        saveToFileButton.grid(row=1, column=0)
-        loadFromFileButton = tk.Button(stateControlFrame, text='Load from file', command=self.loadStateFromFile, width=10)
-        loadFromFileButton.grid(row=1, column=1)
-
-    def createCanvas(self):
-        self.canvas = tk.Canvas(self, width=CANVAS_SIZE[0], height=CANVAS_SIZE[1], bg='black', bd=2, relief="groove")
-        self.canvas.bind("<Button-1>", self.leftClickedCanvasCallback)
-        self.canvas.bind("<Button-3>", self.rightClickedCanvasCallback)
-        self.canvas.bind("<B1-Motion>", self.leftClickedCanvasCallback)
-        self.canvas.bind("<B3-Motion>", self.rightClickedCanvasCallback)
-        self.canvas.bind("<Button-4>", self.zoomIn)
-        self.canvas.bind("<Button-5>", self.zoomOut)
-        self.canvas.bind("<Key>", self.handleKey)
-        self.canvas.focus_set()
-        self.canvas.grid(row=1, column=0, columnspan=4)
-
-    def createBrushFrame(self):
-        brushFrame = tk.Frame(self, width=50)
-        brushFrame.grid(row=1, column=4, sticky="NW")
-
-        brushSizeFrame = tk.Frame(brushFrame)
-        brushSizeFrame.grid(row=0, column=0, sticky="NW", pady=(0, 20))
-        self.brushSizeVar = tk.StringVar()
-        self.updateBrushSizeLabel()
-        brushSizeLabel = tk.Label(brushSizeFrame, textvariable=self.brushSizeVar, anchor="w", width=20)
-        brushSizeLabel.grid(row=0, column=0, columnspan=2, sticky='W')
-        decreaseBrushSizeButton = tk.Button(brushSizeFrame, text='-', command=self.decreaseBrushSize, width=4)
-        decreaseBrushSizeButton.grid(row=1, column=0, sticky="W")
-        increaseBrushSizeButton = tk.Button(brushSizeFrame, text='+', command=self.increaseBrushSize, width=4)
-        increaseBrushSizeButton.grid(row=1, column=1, sticky="W")
-
-        brushRotFrame = tk.Frame(brushFrame)
-        brushRotFrame.grid(row=1, column=0, sticky="NW", pady=(0, 20))
-        self.brushRotVar = tk.StringVar()
-        self.updateBrushRotLabel()
-        brushRotLabel = tk.Label(brushRotFrame, textvariable=self.brushRotVar, anchor="w", width=20)
-        brushRotLabel.grid(row=0, column=0, columnspan=2, sticky='W')
-        rotateBrushLeftButton = tk.Button(brushRotFrame, text='<-', command=self.rotateBrushLeft, width=4)
-        rotateBrushLeftButton.grid(row=1, column=0, sticky='W')
-        rotateBrushRightButton = tk.Button(brushRotFrame, text='->', command=self.rotateBrushRight, width=4)
-        rotateBrushRightButton.grid(row=1, column=1, sticky="W")
-
-        brushTypeFrame = tk.Frame(brushFrame)
-        brushTypeFrame.grid(row=2, column=0, sticky="NW")
-        brushLabel = tk.Label(brushTypeFrame, text="Brushes:", anchor="w", width=20)
-        currow = 0
-        brushLabel.grid(row=currow, column=0, sticky="W")
-        defaultBrushButton = tk.Button(brushTypeFrame, text='Default brush', command=lambda: self.selectBrush(BrushType.default), width=12)
-        currow += 1
-        defaultBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        plusBrushButton = tk.Button(brushTypeFrame, text='Plus', command=lambda: self.selectBrush(BrushType.plus), width=12)
-        currow += 1
-        plusBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        brushLabel = tk.Label(brushTypeFrame, text="Oscillators:", anchor="w", width=20)
-        currow += 1
-        brushLabel.grid(row=currow, column=0, sticky="W")
-        blinkerBrushButton = tk.Button(brushTypeFrame, text='Blinker', command=lambda: self.selectBrush(BrushType.blinker), width=12)
-        currow += 1
-        blinkerBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        toadBrushButton = tk.Button(brushTypeFrame, text='Toad', command=lambda: self.selectBrush(BrushType.toad), width=12)
-        currow += 1
-        toadBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        beaconBrushButton = tk.Button(brushTypeFrame, text='Beacon', command=lambda: self.selectBrush(BrushType.beacon), width=12)
-        currow += 1
-        beaconBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        pulsarBrushButton = tk.Button(brushTypeFrame, text='Pulsar', command=lambda: self.selectBrush(BrushType.pulsar), width=12)
-        currow += 1
-        pulsarBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        portalBrushButton = tk.Button(brushTypeFrame, text='Portal', command=lambda: self.selectBrush(BrushType.portal), width=12)
-        currow += 1
-        portalBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        brushLabel = tk.Label(brushTypeFrame, text="Spaceships:", anchor="w", width=20)
-        currow += 1
-        brushLabel.grid(row=currow, column=0, sticky="W")
-        gliderBrushButton = tk.Button(brushTypeFrame, text='Glider', command=lambda: self.selectBrush(BrushType.glider), width=12)
-        currow += 1
-        gliderBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        lightshipBrushButton = tk.Button(brushTypeFrame, text='Light ship', command=lambda: self.selectBrush(BrushType.light_ship), width=12)
-        currow += 1
-        lightshipBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        heavyshipBrushButton = tk.Button(brushTypeFrame, text='Heavy ship', command=lambda: self.selectBrush(BrushType.heavy_ship), width=12)
-        currow += 1
-        heavyshipBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        brushLabel = tk.Label(brushTypeFrame, text="Guns:", anchor="w", width=20)
-        currow += 1
-        brushLabel.grid(row=currow, column=0, sticky="W")
-        gosperGlidergunBrushButton = tk.Button(brushTypeFrame, text='Gosper glider gun', command=lambda: self.selectBrush(BrushType.gosper_glider_gun), width=12)
-        currow += 1
-        gosperGlidergunBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-        simkinGlidergunBrushButton = tk.Button(brushTypeFrame, text='Simkin glider gun', command=lambda: self.selectBrush(BrushType.simkin_glider_gun), width=12)
-        currow += 1
-        simkinGlidergunBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
-
-    def createWidgets(self):
-        self.createTopFrame()
-        self.createCanvas()
-        self.createBrushFrame()
-
-    ### Drawing ###
-    def refreshView(self, drawGrid=True):
-        if drawGrid:
-            self.canvas.delete(tk.ALL)
-            self.drawGrid()
+        minx = min(cell[0] for cell in cells)
+        miny = min(cell[1] for cell in cells)
+        size = max(max(cell[0] for cell in cells) - minx, max(cell[1] for cell in cells) - miny) + 1
+        k = max(3, (size - 1).bit_length())
+        self.origin = (minx, miny)
+        self.root = self.buildTree(k, minx, miny, cells)
+
+    def treeCells(self, node, x, y, out):
+        if node.n == 0:
+            return
+        if node.k == 0:
+            out.append((x, y))
+            return
+        half = 1 << (node.k - 1)
+        self.treeCells(node.a, x, y, out)
+        self.treeCells(node.b, x + half, y, out)
+        self.treeCells(node.c, x, y + half, out)
+        self.treeCells(node.d, x + half, y + half, out)
+
+    ### Evolution ###
+    def life4x4(self, m):
+        # centre 2x2 of a 4x4 node after one generation
+        grid = [[0]*4 for i in range(4)]
+        for qx, qy, q in ((0, 0, m.a), (2, 0, m.b), (0, 2, m.c), (2, 2, m.d)):
+            grid[qx][qy] = q.a.n
+            grid[qx + 1][qy] = q.b.n
+            grid[qx][qy + 1] = q.c.n
+            grid[qx + 1][qy + 1] = q.d.n
+        res = []
+        table = self.ruleTable
+        for x, y in ((1, 1), (2, 1), (1, 2), (2, 2)):
+            count = sum(grid[i][j] for i in range(x-1, x+2) for j in range(y-1, y+2)) - grid[x][y]
+            res.append(self.on if table[count + 9*grid[x][y]] else self.off)
+        return self.join(*res)
+
+    def successor(self, m, j):
+        # centre half of m advanced 2^j generations, j <= m.k - 2
+        if m.n == 0:
+            return m.a
+        key = (m, j)
+        res = self.stepCache.get(key)
+        if res is not None:
+            return res
+        if m.k == 2:
+            res = self.life4x4(m)
         else:
-            for cell in list(self.cell_rectangles.keys()):
-                self.canvas.delete(self.cell_rectangles[cell])
-                del self.cell_rectangles[cell]
-        self.drawCells()
+            join = self.join
+            a, b, c, d = m.a, m.b, m.c, m.d
+            c1 = self.successor(a, j)
+            c2 = self.successor(join(a.b, b.a, a.d, b.c), j)
+            c3 = self.successor(b, j)
+            c4 = self.successor(join(a.c, a.d, c.a, c.b), j)
+            c5 = self.successor(join(a.d, b.c, c.b, d.a), j)
+            c6 = self.successor(join(b.c, b.d, d.a, d.b), j)
+            c7 = self.successor(c, j)
+            c8 = self.successor(join(c.b, d.a, c.d, d.c), j)
+            c9 = self.successor(d, j)
+            if j < m.k - 2:
+                res = join(join(c1.d, c2.c, c4.b, c5.a),
+                           join(c2.d, c3.c, c5.b, c6.a),
+                           join(c4.d, c5.c, c7.b, c8.a),
+                           join(c5.d, c6.c, c8.b, c9.a))
+            else:
+                res = join(self.successor(join(c1, c2, c4, c5), j),
+                           self.successor(join(c2, c3, c5, c6), j),
+                           self.successor(join(c4, c5, c7, c8), j),
+                           self.successor(join(c5, c6, c8, c9), j))
+        self.stepCache[key] = res
+        return res
+
+    def isPadded(self, m):
+        # all live cells are inside the centre half of m
+        return (m.a.n == m.a.d.d.n and m.b.n == m.b.c.c.n
+                and m.c.n == m.c.b.b.n and m.d.n == m.d.a.a.n)
+
+    def crop(self):
+        root = self.root
+        while root.k > 3 and self.isPadded(root):
+            quarter = 1 << (root.k - 2)
+            self.origin = (self.origin[0] + quarter, self.origin[1] + quarter)
+            root = self.join(root.a.d, root.b.c, root.c.b, root.d.a)
+        self.root = root
+
+    def advance(self, j):
+        # grow the universe until nothing can escape the returned centre within 2^j generations
+        root = self.root
+        while root.k < j + 4 or not self.isPadded(root) or not self.isPadded(self.join(root.a.d, root.b.c, root.c.b, root.d.a)):
+            half = 1 << (root.k - 1)
+            self.origin = (self.origin[0] - half, self.origin[1] - half)
+            root = self.centre(root)
+        quarter = 1 << (root.k - 2)
+        self.origin = (self.origin[0] + quarter, self.origin[1] + quarter)
+        self.root = self.successor(root, j)
+        self.generation += 1 << j
+        self.crop()
+
+    def checkCaches(self):
+        if self.rule != self.cacheRule:
+            self.cacheRule = self.rule
+            self.stepCache.clear()
+        if len(self.nodes) + len(self.stepCache) > self.maxNodes:
+            self.evict()
+
+    def evict(self):
+        # Drop every node not reachable from the root, together with all memoized
+        # successors. Reachable nodes are re-registered so they stay canonical.
+        self.evictions += 1
+        self.stepCache.clear()
+        self.nodes = {}
+        self.empties = [self.off]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.k == 0:
+                continue
+            key = (node.a, node.b, node.c, node.d)
+            if key in self.nodes:
+                continue
+            self.nodes[key] = node
+            stack.extend(key)
+
+    def stepBy(self, n):
+        if n < 0:
+            raise ValueError("HashLife cannot step backwards")
+        if self.root is None:
+            self.loadTree()
+        j = 0
+        while n:
+            if n & 1:
+                self.checkCaches()
+                self.advance(j)
+            n >>= 1
+            j += 1
+        self._cells = None
+
+    def jumpTo(self, generation):
+        self.stepBy(generation - self.generation)
 
-    def addCell(self, cell):
-        x = (cell[0] + self.viewOffset[0])*self.cellsize
-        y = (cell[1] + self.viewOffset[1])*self.cellsize
-        self.cell_rectangles[cell] = self.canvas.create_rectangle(x, y, x + self.cellsize, y + self.cellsize, fill="OrangeRed2", outline="gray22")
-
-    def interfaceAddCell(self, cell):
-        if cell not in self.gamestate.cells:
-            self.gamestate.cells.append(cell)
-            self.addCell(cell)
-
-    def addNewCells(self):
-        for cell in self.gamestate.new_cells:
-            self.addCell(cell)
-
-    def removeDeadCells(self):
-        for cell in self.gamestate.dead_cells:
-            if cell in self.cell_rectangles:
-                self.canvas.delete(self.cell_rectangles[cell])
-                del self.cell_rectangles[cell]
-
-    def drawCells(self):
-        for cell in self.gamestate.cells:
-            cellx = (cell[0] + self.viewOffset[0]) * self.cellsize
-            celly = (cell[1] + self.viewOffset[1]) * self.cellsize
-            if  cellx >= 0 and cellx <= self.canvas.winfo_width() \
-            and celly >= 0 and celly <= self.canvas.winfo_height():
-                self.addCell(cell)
-
-    def drawGrid(self):
-        i = 0
-        self.update()
-        w = self.canvas.winfo_width()
-        h = self.canvas.winfo_height()
-        while i < w:
-            self.canvas.create_line(i, 0, i, h, fill="gray22")
-            i += self.cellsize
-        i = 0
-        while i < h:
-            self.canvas.create_line(0, i, w, i, fill="gray22")
-            i += self.cellsize
+    def updateCells(self):
+        before = set(self.cells)
+        self.stepBy(self.stepSize)
+        after = set(self.cells)
+        self.new_cells = list(after - before)
+        self.dead_cells = list(before - after)
+
+class Chunk():
+    __slots__ = ('cur', 'prev', 'stable', 'changed')
+
+    # cur/prev are the chunk's cells this and last generation; prev is None when the
+    # last generation is unknown because the chunk was created or edited since. stable
+    # means the contents equal those two generations ago (period 1 or 2).
+    def __init__(self, cur, prev, stable, changed):
+        self.cur = cur
+        self.prev = prev
+        self.stable = stable
+        self.changed = changed
+
+class ActiveRegionGameState(GameState):
+    # Splits the plane into square chunks of 1 << CHUNK_SHIFT cells and only recomputes chunks with an
+    # unsettled neighbourhood. A chunk whose whole 3x3 neighbourhood repeats with
+    # period 1 or 2 is dormant and simply swaps back to its previous contents.
+    def __init__(self):
+        self.chunks = {}
+        self.activeChunks = 0
+        self.skippedChunks = 0
+        self.skippedFraction = 0.0
+        GameState.__init__(self)
+        self.new_cells = []
+        self.dead_cells = []
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = [cell for chunk in self.chunks.values() for cell in chunk.cur]
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self.chunks = {}
+        for cell in cells:
+            key = (cell[0] >> CHUNK_SHIFT, cell[1] >> CHUNK_SHIFT)
+            try:
+                self.chunks[key].cur.add(cell)
+            except KeyError:
+                self.chunks[key] = Chunk({cell}, None, False, True)
+        self._cells = None
+
+    def addCells(self, cells):
+        added = []
+        for cell in cells:
+            key = (cell[0] >> CHUNK_SHIFT, cell[1] >> CHUNK_SHIFT)
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = self.chunks[key] = Chunk(set(), None, False, True)
+            elif cell in chunk.cur:
+                continue
+            chunk.cur.add(cell)
+            chunk.prev = None
+            chunk.stable = False
+            chunk.changed = True
+            added.append(cell)
+        self._cells = None
+        return added
+
+    def removeCells(self, cells):
+        removed = []
+        for cell in cells:
+            chunk = self.chunks.get((cell[0] >> CHUNK_SHIFT, cell[1] >> CHUNK_SHIFT))
+            if chunk is None or cell not in chunk.cur:
+                continue
+            chunk.cur.discard(cell)
+            chunk.prev = None
+            chunk.stable = False
+            chunk.changed = True
+            removed.append(cell)
+        self._cells = None
+        return removed
+
+    def updateCells(self):
+        chunks = self.chunks
+        tracked = len(chunks)
+        active = set()
+        for (cx, cy), chunk in chunks.items():
+            if not chunk.stable:
+                for i in range(cx-1, cx+2):
+                    for j in range(cy-1, cy+2):
+                        active.add((i, j))
+        self.new_cells = []
+        self.dead_cells = []
+
+        # active chunks are greeted by their own cells and those of the chunks around them
+        self.potential_cells = {}
+        sources = set()
+        for cx, cy in active:
+            for i in range(cx-1, cx+2):
+                for j in range(cy-1, cy+2):
+                    sources.add((i, j))
+        edge = (1 << CHUNK_SHIFT) - 1
+        for key in sources:
+            chunk = chunks.get(key)
+            if chunk is None:
+                continue
+            if key in active:
+                for cell in chunk.cur:
+                    self.greetActiveNeighbours(cell)
+            else:
+                # only the border cells of a dormant chunk can reach an active one
+                for cell in chunk.cur:
+                    if cell[0] & edge in (0, edge) or cell[1] & edge in (0, edge):
+                        self.greetActiveNeighbours(cell)
+        nextcells = {}
+        table = self.ruleTable
+        for cell, count in self.potential_cells.items():
+            key = (cell[0] >> CHUNK_SHIFT, cell[1] >> CHUNK_SHIFT)
+            if key not in active:
+                continue
+            chunk = chunks.get(key)
+            if table[count + 9*(chunk is not None and cell in chunk.cur)]:
+                try:
+                    nextcells[key].add(cell)
+                except KeyError:
+                    nextcells[key] = {cell}
+        if table[9]:
+            # lone live cells are never greeted, but S0 rules keep them
+            for key in active:
+                chunk = chunks.get(key)
+                for cell in chunk.cur if chunk is not None else ():
+                    if cell not in self.potential_cells:
+                        try:
+                            nextcells[key].add(cell)
+                        except KeyError:
+                            nextcells[key] = {cell}
+
+        # dormant chunks flip back to the previous generation
+        skipped = 0
+        for key, chunk in chunks.items():
+            if key in active:
+                continue
+            skipped += 1
+            if chunk.changed:
+                self.new_cells.extend(chunk.prev - chunk.cur)
+                self.dead_cells.extend(chunk.cur - chunk.prev)
+                chunk.cur, chunk.prev = chunk.prev, chunk.cur
+
+        empty = set()
+        for key in active:
+            chunk = chunks.get(key)
+            cur = nextcells.get(key, empty)
+            if chunk is None:
+                if cur:
+                    self.new_cells.extend(cur)
+                    chunks[key] = Chunk(cur, set(), False, True)
+                continue
+            if cur:
+                self.new_cells.extend(cur - chunk.cur)
+                self.dead_cells.extend(chunk.cur - cur)
+            else:
+                self.dead_cells.extend(chunk.cur)
+            stable = cur == chunk.prev
+            if stable and not cur and not chunk.cur:
+                del chunks[key]
+                continue
+            chunk.changed = cur != chunk.cur
+            chunk.stable = stable
+            chunk.cur, chunk.prev = (cur if cur else set()), chunk.cur
+
+        self.activeChunks = tracked - skipped
+        self.skippedChunks = skipped
+        self.skippedFraction = skipped / tracked if tracked else 0.0
+        self._cells = None
+
+    def greetActiveNeighbours(self, cell):
+        potential_cells = self.potential_cells
+        for i in range(cell[0]-1, cell[0]+2):
+            for j in range(cell[1]-1, cell[1]+2):
+                if cell != (i, j):
+                    try:
+                        potential_cells[(i, j)] += 1
+                    except KeyError:
+                        potential_cells[(i, j)] = 1
+
+# Per-worker cache of attached shared memory blocks, keyed by block name
+_workerBlocks = {}
+
+def _attachBlock(name):
+    block = _workerBlocks.get(name)
+    if block is None:
+        # drop the oldest blocks, never the one the current tile has just attached
+        while len(_workerBlocks) >= 4:
+            _workerBlocks.pop(next(iter(_workerBlocks))).close()
+        from multiprocessing import shared_memory
+        block = shared_memory.SharedMemory(name=name)
+        _workerBlocks[name] = block
+    return block
+
+def stepTile(task):
+    # Computes tile [x0:x1, y0:y1] of the next board. The tile reads a one-cell halo
+    # from its neighbouring tiles straight out of the shared current board.
+    curName, nextName, shape, x0, x1, y0, y1, rules = task
+    loadNumpy()
+    cur = np.ndarray(shape, dtype=bool, buffer=_attachBlock(curName).buf)
+    nxt = np.ndarray(shape, dtype=bool, buffer=_attachBlock(nextName).buf)
+    hx0, hx1 = max(x0 - 1, 0), min(x1 + 1, shape[0])
+    hy0, hy1 = max(y0 - 1, 0), min(y1 + 1, shape[1])
+    halo = cur[hx0:hx1, hy0:hy1]
+    tile = denseNextBoard(halo, denseNeighbourCounts(halo), rules)
+    nxt[x0:x1, y0:y1] = tile[x0 - hx0:x0 - hx0 + x1 - x0, y0 - hy0:y0 - hy0 + y1 - y0]
+
+class ParallelGameState(DenseGameState):
+    # Dense engine whose board lives in shared memory and is stepped tile by tile
+    # on a process pool. Births and deaths are merged back in the main process.
+    def __init__(self, workers=None, tileSize=PARALLEL_TILE_SIZE):
+        self.workers = workers or os.cpu_count()
+        self.tileSize = tileSize
+        self.pool = None
+        self.blocks = []
+        self.sharedBoards = []
+        DenseGameState.__init__(self)
+
+    def allocateShared(self, shape):
+        from multiprocessing import shared_memory
+        self.releaseShared()
+        size = max(shape[0] * shape[1], 1)
+        for i in range(2):
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks.append(block)
+            self.sharedBoards.append(np.ndarray(shape, dtype=bool, buffer=block.buf))
+
+    def releaseShared(self):
+        self.sharedBoards = []
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        self.releaseShared()
+
+    def __del__(self):
+        self.close()
+
+    def tiles(self, shape):
+        for x0 in range(0, shape[0], self.tileSize):
+            for y0 in range(0, shape[1], self.tileSize):
+                yield x0, min(x0 + self.tileSize, shape[0]), y0, min(y0 + self.tileSize, shape[1])
+
+    def updateCells(self):
+        if self.board is None:
+            self.loadBoard()
+        self.fitBoard()
+        board = self.board
+        tiles = list(self.tiles(board.shape))
+        if self.workers <= 1 or len(tiles) <= 1:
+            DenseGameState.updateCells(self)
+            return
+        if not self.sharedBoards or self.sharedBoards[0].shape != board.shape:
+            self.allocateShared(board.shape)
+        if board is not self.sharedBoards[0]:
+            self.sharedBoards[0][...] = board
+            board = self.board = self.sharedBoards[0]
+        if self.pool is None:
+            import multiprocessing
+            self.pool = multiprocessing.Pool(self.workers)
+        rules = self.ruleRanges
+        curName, nextName = self.blocks[0].name, self.blocks[1].name
+        self.pool.map(stepTile, [(curName, nextName, board.shape) + tile + (rules,) for tile in tiles])
+        nextboard = self.sharedBoards[1]
+        self.new_cells = self.boardCells(nextboard & ~board)
+        self.dead_cells = self.boardCells(board & ~nextboard)
+        self.blocks.reverse()
+        self.sharedBoards.reverse()
+        self.board = nextboard
+        self._cells = None
+
+ENGINES = {
+    "sparse": GameState,
+    "dense": DenseGameState,
+    "auto": AdaptiveGameState,
+    "hashlife": HashLifeGameState,
+    "active": ActiveRegionGameState,
+    "parallel": ParallelGameState,
+    "packed": PackedGameState,
+    "rows": RowGameState,
+}
+DEFAULT_ENGINE = "auto" if HAVE_NUMPY else "sparse"
+
+def createEngine(engine, workers=None, tileSize=PARALLEL_TILE_SIZE):
+    # workers and tileSize configure the parallel engine's pool, the others ignore them
+    if engine == "parallel":
+        return ParallelGameState(workers, tileSize)
+    return ENGINES[engine]()
+
+class CycleDetector():
+    # Recognises a population that repeats itself, possibly displaced. The hash
+    # h = sum(X^x * Y^y) of the live cells becomes h * X^dx * Y^dy when the population
+    # moves by (dx, dy), so h^n * X^-sumx * Y^-sumy (n = population) is the same
+    # wherever it is. h, n and the coordinate sums are kept up to date from each
+    # generation's births and deaths, and the key is looked up among recent generations.
+    def __init__(self, history=CYCLE_HISTORY):
+        self.history = history
+        self.powers = ({}, {})
+        self.reset([])
+
+    def reset(self, cells, generation=0):
+        self.hash = 0
+        self.population = 0
+        self.sumX = 0
+        self.sumY = 0
+        self.generation = generation
+        self.update(cells, [])
+        self.clear()
+
+    def clear(self):
+        # forget the history, after edits or rule changes
+        self.seen = {}
+        self.order = deque()
+        self.rule = None
+        self.period = None
+        self.displacement = None
+        self.cycleStart = None
+        self.remember()
+
+    def remember(self):
+        key = self.key()
+        self.seen[key] = (self.generation, self.sumX, self.sumY)
+        self.order.append((key, self.generation))
+        if len(self.order) > self.history:
+            old, generation = self.order.popleft()
+            if self.seen[old][0] == generation:
+                del self.seen[old]
+
+    def power(self, axis, exponent):
+        cache = self.powers[axis]
+        try:
+            return cache[exponent]
+        except KeyError:
+            value = cache[exponent] = pow(CYCLE_HASH_BASES[axis], exponent, CYCLE_HASH_MODULUS)
+            return value
+
+    def update(self, born, died):
+        h = self.hash
+        for x, y in born:
+            h += self.power(0, x) * self.power(1, y)
+            self.sumX += x
+            self.sumY += y
+        for x, y in died:
+            h -= self.power(0, x) * self.power(1, y)
+            self.sumX -= x
+            self.sumY -= y
+        self.hash = h % CYCLE_HASH_MODULUS
+        self.population += len(born) - len(died)
+
+    def edit(self, added, removed, generation=None):
+        self.update(added, removed)
+        if generation is not None:
+            self.generation = generation
+        self.clear()
+
+    def key(self):
+        m = CYCLE_HASH_MODULUS
+        value = pow(self.hash, self.population, m) * pow(CYCLE_HASH_BASES[0], -self.sumX, m) * pow(CYCLE_HASH_BASES[1], -self.sumY, m) % m
+        return (self.population, value)
+
+    def record(self, gamestate, generations=1):
+        # Call after every step of gamestate. Returns True when this step completed a
+        # cycle; period/displacement then describe it until the next edit.
+        if gamestate.rule != self.rule:
+            if self.rule is not None:
+                self.clear()
+            self.rule = gamestate.rule
+        self.update(gamestate.new_cells, gamestate.dead_cells)
+        self.generation += generations
+        key = self.key()
+        found = False
+        if self.period is None and key in self.seen:
+            generation, sumX, sumY = self.seen[key]
+            n = self.population or 1
+            dx, restX = divmod(self.sumX - sumX, n)
+            dy, restY = divmod(self.sumY - sumY, n)
+            if not restX and not restY: # otherwise a hash collision
+                self.period = self.generation - generation
+                self.displacement = (dx, dy)
+                self.cycleStart = generation
+                found = True
+        self.remember()
+        return found
+
+    def fastForward(self, gamestate, generations):
+        # Every period generations the population reappears moved by displacement, so
+        # only the remainder is simulated and the rest is a translation.
+        laps, rest = divmod(generations, self.period)
+        if isinstance(gamestate, HashLifeGameState):
+            gamestate.stepBy(rest)
+        else:
+            for i in range(rest):
+                gamestate.updateCells()
+        dx, dy = self.displacement[0] * laps, self.displacement[1] * laps
+        if dx or dy:
+            gamestate.cells = [(x + dx, y + dy) for x, y in gamestate.cells]
+        cycle = (self.rule, self.period, self.displacement, self.cycleStart)
+        self.reset(gamestate.cells, self.generation + generations)
+        self.rule, self.period, self.displacement, self.cycleStart = cycle
+
+def runHeadless(args):
+    cells = loadCells(args.state)
+    gamestate = createEngine(args.engine, args.workers, args.tile_size)
+    gamestate.setRule(args.rule)
+    gamestate.cells = cells
+    start = perf_counter()
+    if args.on_cycle != "ignore":
+        detector = CycleDetector()
+        detector.reset(gamestate.cells)
+        while detector.generation < args.generations:
+            gamestate.updateCells()
+            if detector.record(gamestate):
+                dx, dy = detector.displacement
+                print(f"Generation {detector.generation}: cycle of period {detector.period}, displacement ({dx}, {dy}), since generation {detector.cycleStart}")
+                if args.on_cycle == "skip":
+                    detector.fastForward(gamestate, args.generations - detector.generation)
+                break
+    elif isinstance(gamestate, HashLifeGameState):
+        gamestate.stepBy(args.generations)
+    else:
+        for i in range(args.generations):
+            gamestate.updateCells()
+    elapsed = perf_counter() - start
+    cells = gamestate.cells
+    gamestate.close()
+    if args.output:
+        saveCells(args.output, cells)
+    generations = detector.generation if args.on_cycle != "ignore" else args.generations
+    rate = generations / elapsed if elapsed > 0 else float("inf")
+    print(f"{args.engine}: {generations} generations in {elapsed:.3f}s ({rate:.1f} gen/s), final population {len(cells)}")
+
+### Sweeps ###
+# A sweep runs every rule x seed x density soup headlessly in a process pool and
+# streams one record per finished run: a SWEEP_RUN header, the rulestring, then the
+# population, births and deaths columns (one uint32 per generation each, column after
+# column) compressed together with zlib.
+SWEEP_HEADER = struct.Struct("<4sB")
+SWEEP_RUN = struct.Struct("<IqdIIdIBHI")
+SWEEP_END_REASONS = ["generations", "time", "extinct", "cycle"]
+
+def sweepRule(value):
+    # a rulestring, or "underpopulation,overpopulation,reborn" as in the rules popup
+    parts = value.split(",")
+    if len(parts) == 3:
+        try:
+            under, over, reborn = (int(part) for part in parts)
+        except ValueError:
+            raise ValueError(f"Invalid thresholds: {value}")
+        # unlike the popup, a sweep refuses numbers that would run a different rule
+        if not 0 <= under <= over <= 8 or not 1 <= reborn <= 8:
+            raise ValueError(f"Invalid thresholds: {value}, need 0 <= underpopulation <= overpopulation <= 8 and 1 <= reborn <= 8")
+        value = thresholdRule(under, over, reborn)
+    born, survive = parseRule(value)
+    return formatRule(born, survive)
+
+def sweepSeeds(values):
+    # integers and inclusive ranges like 0-99
+    seeds = []
+    for value in values:
+        first, dash, last = value.partition("-")
+        try:
+            if dash and first:
+                seeds.extend(range(int(first), int(last) + 1))
+            else:
+                seeds.append(int(value))
+        except ValueError:
+            raise ValueError(f"Invalid seed: {value}")
+    return seeds
+
+def sweepRun(job):
+    # Runs on a pool worker. Returns the job with the end reason, cycle period,
+    # elapsed time and the packed columns.
+    index, rule, seed, density, size, generations, timeLimit, engine, stopOnCycle = job
+    gamestate = ENGINES[engine]()
+    gamestate.setRule(rule)
+    gamestate.cells = randomSoup(size, size, density, seed)
+    population = len(gamestate.cells)
+    detector = None
+    if stopOnCycle:
+        detector = CycleDetector()
+        detector.reset(gamestate.cells)
+    populations, births, deaths = array("I"), array("I"), array("I")
+    end, period = "generations", 0
+    start = perf_counter()
+    for generation in range(generations):
+        gamestate.updateCells()
+        born, died = len(gamestate.new_cells), len(gamestate.dead_cells)
+        population += born - died
+        populations.append(population)
+        births.append(born)
+        deaths.append(died)
+        if population == 0:
+            end = "extinct"
+            break
+        if detector is not None and detector.record(gamestate):
+            end, period = "cycle", detector.period
+            break
+        if perf_counter() - start > timeLimit:
+            end = "time"
+            break
+    elapsed = perf_counter() - start
+    gamestate.close()
+    if sys.byteorder == "big":
+        for column in (populations, births, deaths):
+            column.byteswap()
+    columns = zlib.compress(populations.tobytes() + births.tobytes() + deaths.tobytes(), BINARY_COMPRESSION_LEVEL)
+    return index, rule, seed, density, size, len(populations), elapsed, end, period, columns
+
+def runSweep(args):
+    import multiprocessing
+
+    rules = [sweepRule(rule) for rule in args.rules]
+    seeds = sweepSeeds(args.seeds)
+    jobs = [(index, rule, seed, density, args.size, args.generations, args.time_limit, args.engine, args.stop_on_cycle)
+            for index, (rule, seed, density) in enumerate((rule, seed, density) for rule in rules for seed in seeds for density in args.densities)]
+    start = perf_counter()
+    ends = dict.fromkeys(SWEEP_END_REASONS, 0)
+    with open(args.output, "wb") as fd, multiprocessing.Pool(args.workers) as pool:
+        fd.write(SWEEP_HEADER.pack(SWEEP_MAGIC, SWEEP_VERSION))
+        for done, (index, rule, seed, density, size, length, elapsed, end, period, columns) in enumerate(pool.imap_unordered(sweepRun, jobs), 1):
+            rule = rule.encode()
+            fd.write(SWEEP_RUN.pack(index, seed, density, size, length, elapsed, period, SWEEP_END_REASONS.index(end), len(rule), len(columns)))
+            fd.write(rule)
+            fd.write(columns)
+            ends[end] += 1
+            if done % SWEEP_REPORT_INTERVAL == 0 or done == len(jobs):
+                fd.flush()
+                print(f"{done}/{len(jobs)} runs, {perf_counter() - start:.1f}s")
+    print(f"{len(jobs)} runs written to {args.output}: " + ", ".join(f"{count} {end}" for end, count in ends.items() if count))
+
+def iterSweepRuns(filename):
+    # Yields one dict per run of a sweep file, with the population, births and deaths
+    # columns as arrays. Stops quietly at a record cut short by an interrupted sweep.
+    with open(filename, "rb") as fd:
+        header = fd.read(SWEEP_HEADER.size)
+        if len(header) < SWEEP_HEADER.size or SWEEP_HEADER.unpack(header) != (SWEEP_MAGIC, SWEEP_VERSION):
+            raise StateFileError(None, "not a sweep file")
+        while True:
+            record = fd.read(SWEEP_RUN.size)
+            if len(record) < SWEEP_RUN.size:
+                return
+            index, seed, density, size, length, elapsed, period, end, ruleLength, columnsLength = SWEEP_RUN.unpack(record)
+            rule = fd.read(ruleLength)
+            columns = fd.read(columnsLength)
+            if len(columns) < columnsLength:
+                return
+            values = array("I")
+            values.frombytes(zlib.decompress(columns))
+            if sys.byteorder == "big":
+                values.byteswap()
+            yield {"index": index, "rule": rule.decode(), "seed": seed, "density": density, "size": size,
+                   "elapsed": elapsed, "end": SWEEP_END_REASONS[end], "period": period,
+                   "population": values[:length], "births": values[length:2 * length], "deaths": values[2 * length:]}
+
+### Census ###
+# Runs random soups until their population settles, splits the ash into objects and
+# names each object by its period, whether it moves, and its canonical cells. Names
+# are cached by the hash of every phase's canonical form, so only objects never seen
+# before are simulated on their own to find their period.
+CENSUS_STILL_LIFES = {
+    "block": [(0, 0), (1, 0), (0, 1), (1, 1)],
+    "beehive": [(1, 0), (2, 0), (0, 1), (3, 1), (1, 2), (2, 2)],
+    "loaf": [(1, 0), (2, 0), (0, 1), (3, 1), (1, 2), (3, 2), (2, 3)],
+    "boat": [(0, 0), (1, 0), (0, 1), (2, 1), (1, 2)],
+    "ship": [(0, 0), (1, 0), (0, 1), (2, 1), (1, 2), (2, 2)],
+    "tub": [(1, 0), (0, 1), (2, 1), (1, 2)],
+    "pond": [(1, 0), (2, 0), (0, 1), (3, 1), (0, 2), (3, 2), (1, 3), (2, 3)],
+}
+CENSUS_UNSTABLE = "zz_unstable"
+CENSUS_WORKER_CACHE = None # set in each pool worker by censusInit
+
+def settledPeriod(populations, maxPeriod=CENSUS_MAX_PERIOD):
+    # the smallest period the population count has kept over the last two longest
+    # periods, or None while it is still changing
+    window = 2 * maxPeriod
+    if len(populations) < window + maxPeriod:
+        return None
+    recent = populations[-window:]
+    for period in range(1, maxPeriod + 1):
+        if populations[-window - period:-period] == recent:
+            return period
+    return None
+
+def splitObjects(cells, distance=CENSUS_OBJECT_DISTANCE):
+    # groups of cells linked through live cells at most distance apart
+    remaining = set(cells)
+    offsets = [(dx, dy) for dx in range(-distance, distance + 1) for dy in range(-distance, distance + 1) if dx or dy]
+    objects = []
+    while remaining:
+        start = remaining.pop()
+        group = [start]
+        stack = [start]
+        while stack:
+            x, y = stack.pop()
+            for dx, dy in offsets:
+                cell = (x + dx, y + dy)
+                if cell in remaining:
+                    remaining.remove(cell)
+                    group.append(cell)
+                    stack.append(cell)
+        objects.append(group)
+    return objects
+
+def censusKey(form):
+    import hashlib
+
+    return hashlib.blake2b(repr(form).encode(), digest_size=12).hexdigest()
+
+def classifyObject(cells, rule, maxPeriod=CENSUS_MAX_PERIOD):
+    # Simulates the object alone until it repeats. Returns its code and the canonical
+    # form of each of its phases; objects that don't repeat from their first phase
+    # within maxPeriod generations are CENSUS_UNSTABLE.
+    gamestate = GameState()
+    gamestate.setRule(rule)
+    gamestate.cells = list(cells)
+    detector = CycleDetector()
+    detector.reset(gamestate.cells)
+    phases = [canonicalCells(cells)]
+    for generation in range(maxPeriod):
+        gamestate.updateCells()
+        if detector.record(gamestate):
+            if detector.cycleStart != 0:
+                break
+            if detector.displacement != (0, 0):
+                prefix = f"xq{detector.period}"
+            elif detector.period == 1:
+                prefix = f"xs{len(cells)}"
+            else:
+                prefix = f"xp{detector.period}"
+            form = min(phases)
+            rows = [0] * (max(y for x, y in form) + 1)
+            for x, y in form:
+                rows[y] |= 1 << x
+            return prefix + "_" + "-".join(f"{row:x}" for row in rows), phases
+        if not gamestate.cellSet:
+            break
+        phases.append(canonicalCells(gamestate.cells))
+    return CENSUS_UNSTABLE, phases
+
+def censusNames(rule):
+    # readable names for the codes of the common still lifes and the brush mask
+    # patterns, which are only meaningful under the default rule
+    if rule != DEFAULT_RULE:
+        return {}
+    patterns = dict(CENSUS_STILL_LIFES)
+    for brush in BrushType:
+        if brush in (BrushType.default, BrushType.SIZE):
+            continue
+        try:
+            patterns[brush.name] = brushOrientations(brushPath(brush))[0]
+        except (ImportError, OSError, StateFileError):
+            pass
+    names = {}
+    for name, cells in patterns.items():
+        code, phases = classifyObject(cells, rule)
+        if code != CENSUS_UNSTABLE:
+            names[code] = name
+    return names
+
+def censusInit(cache):
+    global CENSUS_WORKER_CACHE
+    CENSUS_WORKER_CACHE = cache
+
+def censusSoup(job):
+    # Runs on a pool worker. Returns the seed, the generation the soup settled at (None
+    # if it didn't), the object counts by code and the cache entries it added.
+    seed, rule, density, size, maxGenerations, engine = job
+    cache = CENSUS_WORKER_CACHE
+    gamestate = ENGINES[engine]()
+    gamestate.setRule(rule)
+    gamestate.cells = randomSoup(size, size, density, seed)
+    population = len(gamestate.cells)
+    populations = []
+    settled = None
+    for generation in range(1, maxGenerations + 1):
+        gamestate.updateCells()
+        population += len(gamestate.new_cells) - len(gamestate.dead_cells)
+        populations.append(population)
+        if generation % CENSUS_CHECK_INTERVAL == 0 and settledPeriod(populations):
+            settled = generation
+            break
+    if settled is None:
+        gamestate.close()
+        return seed, None, {}, {}
+    # objects are split on every cell that is alive during the next longest period, so
+    # that no phase of an oscillator falls apart; each is then classified by its
+    # cells in the last of those generations
+    ash = set(gamestate.cells)
+    for generation in range(CENSUS_MAX_PERIOD):
+        gamestate.updateCells()
+        ash.update(gamestate.new_cells)
+    current = set(gamestate.cells)
+    gamestate.close()
+    counts = {}
+    added = {}
+    for group in splitObjects(ash):
+        cells = [cell for cell in group if cell in current]
+        if not cells:
+            continue
+        code = cache.get(censusKey(canonicalCells(cells)))
+        if code is None:
+            code, phases = classifyObject(cells, rule)
+            for form in phases:
+                added[censusKey(form)] = code
+            cache.update(added)
+        counts[code] = counts.get(code, 0) + 1
+    return seed, settled, counts, added
+
+def runCensus(args):
+    import json
+    import multiprocessing
+
+    rule = sweepRule(args.rule)
+    caches = {}
+    if os.path.exists(args.cache):
+        with open(args.cache) as fd:
+            caches = json.load(fd)
+    cache = caches.setdefault(rule, {})
+    known = len(cache)
+    names = censusNames(rule)
+    jobs = [(seed, rule, args.density, args.size, args.generations, args.engine) for seed in sweepSeeds(args.seeds)]
+    counts = {}
+    unsettled = 0
+    start = perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=censusInit, initargs=(cache,)) as pool:
+        for done, (seed, settled, soupCounts, added) in enumerate(pool.imap_unordered(censusSoup, jobs), 1):
+            if settled is None:
+                unsettled += 1
+            for code, count in soupCounts.items():
+                counts[code] = counts.get(code, 0) + count
+            cache.update(added)
+            if done % SWEEP_REPORT_INTERVAL == 0 or done == len(jobs):
+                print(f"{done}/{len(jobs)} soups, {perf_counter() - start:.1f}s")
+    # written next to the old cache first so an interrupted write can't lose it
+    with open(args.cache + ".tmp", "w") as fd:
+        json.dump(caches, fd)
+    os.replace(args.cache + ".tmp", args.cache)
+    print(f"{len(jobs)} soups under {rule}, {unsettled} did not settle within {args.generations} generations, "
+          f"{len(cache) - known} new phases cached")
+    for code, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:args.top]:
+        print(f"{count:10d}  {code}" + (f"  ({names[code]})" if code in names else ""))
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump({"rule": rule, "soups": len(jobs), "unsettled": unsettled,
+                       "objects": {code: {"count": count, "name": names.get(code)} for code, count in counts.items()}}, fd, indent=1)
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Game of Life")
+    subparsers = parser.add_subparsers(dest="command")
+    gui = subparsers.add_parser("gui", help="open the tkinter application (default)")
+    gui.add_argument("--engine", choices=ENGINES.keys(), default=DEFAULT_ENGINE)
+    gui.add_argument("--renderer", choices=["raster", "items"], default="raster", help="draw one image per frame, or one canvas item per cell")
+    gui.add_argument("--workers", type=int, default=None, help="parallel engine: worker processes, defaults to the number of cores")
+    gui.add_argument("--tile-size", type=int, default=PARALLEL_TILE_SIZE, help="parallel engine: edge length of the tiles handed to each worker")
+    gui.add_argument("--hud", action="store_true", help="start with the performance overlay shown")
+    gui.add_argument("--metrics", help="write one JSON line of timings and counters per frame to this file")
+    gui.add_argument("--profile", type=int, default=0, metavar="GENERATIONS",
+                     help="run cProfile over the next GENERATIONS generations and the frames drawn meanwhile")
+    gui.add_argument("--profile-output", default="gameoflife.prof", help="where to write the profile stats")
+    run = subparsers.add_parser("run", help="simulate a state file without opening a window")
+    run.add_argument("state", help="state file with one x,y line per live cell")
+    run.add_argument("-n", "--generations", type=int, default=100)
+    run.add_argument("-o", "--output", help="where to write the final state")
+    run.add_argument("--engine", choices=ENGINES.keys(), default=DEFAULT_ENGINE)
+    run.add_argument("--workers", type=int, default=None, help="parallel engine: worker processes, defaults to the number of cores")
+    run.add_argument("--tile-size", type=int, default=PARALLEL_TILE_SIZE, help="parallel engine: edge length of the tiles handed to each worker")
+    run.add_argument("--rule", default=DEFAULT_RULE, help="Life-like rulestring, e.g. B36/S23")
+    run.add_argument("--on-cycle", choices=["ignore", "stop", "skip"], default="ignore",
+                     help="watch for a repeating population and stop there, or skip ahead to the last generation")
+    sweep = subparsers.add_parser("sweep", help="run a grid of rules x seeds x densities in a process pool")
+    sweep.add_argument("--rules", nargs="+", default=[DEFAULT_RULE],
+                       help="rulestrings, or underpopulation,overpopulation,reborn triples as in the rules popup")
+    sweep.add_argument("--seeds", nargs="+", default=["0-9"], help="random soup seeds, e.g. 0-99 7 42")
+    sweep.add_argument("--densities", nargs="+", type=float, default=[0.35])
+    sweep.add_argument("--size", type=int, default=64, help="edge length of the square random soups")
+    sweep.add_argument("-n", "--generations", type=int, default=1000, help="generation limit per run")
+    sweep.add_argument("--time-limit", type=float, default=60.0, help="seconds per run before it is cut short")
+    sweep.add_argument("--stop-on-cycle", action="store_true", help="end a run once its population repeats")
+    sweep.add_argument("--engine", choices=[engine for engine in ENGINES if engine != "parallel"], default=DEFAULT_ENGINE)
+    sweep.add_argument("--workers", type=int, default=None, help="pool size, defaults to the number of cores")
+    sweep.add_argument("-o", "--output", default="sweep.gols", help="where to stream the per-generation series")
+    census = subparsers.add_parser("census", help="run random soups until they settle and count the objects left")
+    census.add_argument("--rule", default=DEFAULT_RULE, help="rulestring, or underpopulation,overpopulation,reborn")
+    census.add_argument("--seeds", nargs="+", default=["0-99"], help="random soup seeds, e.g. 0-9999")
+    census.add_argument("--density", type=float, default=0.5)
+    census.add_argument("--size", type=int, default=16, help="edge length of the square random soups")
+    census.add_argument("-n", "--generations", type=int, default=20000, help="give up on soups still changing after this")
+    census.add_argument("--engine", choices=[engine for engine in ENGINES if engine != "parallel"], default="sparse")
+    census.add_argument("--workers", type=int, default=None, help="pool size, defaults to the number of cores")
+    census.add_argument("--cache", default=CENSUS_CACHE, help="classified objects, kept between runs")
+    census.add_argument("--top", type=int, default=30, help="number of objects printed")
+    census.add_argument("-o", "--output", help="also write the census as JSON")
+    args = parser.parse_args(argv)
+    if args.command in ("gui", "run") and (args.tile_size < 1 or (args.workers is not None and args.workers < 1)):
+        parser.error("--workers and --tile-size must be positive")
+
+    if args.command == "census":
+        try:
+            sweepRule(args.rule)
+            sweepSeeds(args.seeds)
+        except ValueError as e:
+            parser.error(str(e))
+        if not 0 <= args.density <= 1:
+            parser.error("density must be between 0 and 1")
+        runCensus(args)
+    elif args.command == "sweep":
+        try:
+            for rule in args.rules:
+                sweepRule(rule)
+            sweepSeeds(args.seeds)
+        except ValueError as e:
+            parser.error(str(e))
+        if any(not 0 <= density <= 1 for density in args.densities):
+            parser.error("densities must be between 0 and 1")
+        runSweep(args)
+    elif args.command == "run":
+        try:
+            parseRule(args.rule)
+        except ValueError as e:
+            parser.error(str(e))
+        runHeadless(args)
+    else:
+        import gui
+        if getattr(args, "profile", 0) < 0:
+            parser.error("--profile must not be negative")
+        gui.main(getattr(args, "engine", DEFAULT_ENGINE), getattr(args, "renderer", gui.DEFAULT_RENDERER), getattr(args, "hud", False),
+                 getattr(args, "metrics", None), getattr(args, "profile", 0), getattr(args, "profile_output", gui.PROFILE_OUTPUT),
+                 getattr(args, "workers", None), getattr(args, "tile_size", PARALLEL_TILE_SIZE))
 
 if __name__ == "__main__":
-    loadBrushMasks()
-    root = tk.Tk()
-    app = Application(root)
-    app.master.title("Game of Life")
-    app.after(UPDATE_FREQS[0], app.updateLoop)
-    app.mainloop()
\ No newline at end of file
+    main()
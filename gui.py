@@ -0,0 +1,1492 @@
+import tkinter as tk
+from tkinter import filedialog
+from tkinter.messagebox import showerror
+from tkinter.simpledialog import askinteger
+from PIL import Image, ImageDraw, ImageTk
+
+from time import time, perf_counter
+import cProfile
+import json
+import math
+import os
+import pstats
+import queue
+import threading
+import traceback
+from collections import deque, Counter
+
+from gameoflife import BrushType, brushPath, brushOrientations, importedBrushes, iterCellChunks, saveCells, StateFileError, \
+    DEFAULT_ENGINE, PARALLEL_TILE_SIZE, createEngine, HashLifeGameState, ActiveRegionGameState, CycleDetector, parseRule, thresholdRule, ruleRanges
+
+FPS = 30
+CANVAS_SIZE = (1000, 800)
+# milliseconds between generations for each speed setting, 0 runs as fast as the engine can
+UPDATE_FREQS = [500, 250, 125, 60, 30, 10, 0]
+MAX_CELLSIZE = 100
+ZOOM_FREQ = 0.5
+CELL_COLOR = "OrangeRed2"
+GRID_COLOR = "gray22"
+# Raster renderer equivalents of the colors above (PIL doesn't know the Tk color names)
+RASTER_CELL_RGB = (238, 64, 0)
+RASTER_GRID_RGB = (56, 56, 56)
+RENDERERS = ["raster", "items"]
+DEFAULT_RENDERER = "raster"
+STATE_FILETYPES = (("state files", "*.txt *.rle *.cells *.golb"), ("text", "*.txt"), ("RLE", "*.rle"), ("plaintext", "*.cells"), ("binary", "*.golb"), ("all files", "*.*"))
+# Undo history: memory budget, generations between full keyframes, estimated bytes per stored cell
+UNDO_HISTORY_BYTES = 64 * 1024 * 1024
+UNDO_KEYFRAME_INTERVAL = 64
+UNDO_CELL_BYTES = 64
+# HashLife: largest power-of-two step the speed buttons reach
+HASHLIFE_MAX_STEP_EXPONENT = 16
+# Viewport index: edge length of its chunks is 1 << VIEW_CHUNK_SHIFT cells
+VIEW_CHUNK_SHIFT = 5
+# Canvas tags of the cell rectangles and the grid image in the items renderer
+CELL_TAG = "cell"
+GRID_TAG = "grid"
+# Number of cell sizes whose grid image is kept
+GRID_CACHE_SIZE = 8
+# Density view below the smallest cell size: a pixel covers up to 1 << DENSITY_MAX_SHIFT
+# cells per side, the pyramid keeps block counts up to 1 << DENSITY_PYRAMID_LEVELS cells
+DENSITY_MAX_SHIFT = 12
+DENSITY_PYRAMID_LEVELS = 24
+# A level with at most this many blocks per pixel in view is scanned instead of descended
+DENSITY_SCAN_RATIO = 8
+# Number of brightness steps a pixel is shaded with, and pixels moved per arrow key
+DENSITY_SHADES = 32
+DENSITY_PAN_PIXELS = 8
+# Timed phases of a generation (worker) and of a frame (Tk), reported per frame in the
+# overlay and the metrics file
+PERF_PHASES = ["step", "undo", "index", "cycle", "draw"]
+HUD_TAG = "hud"
+HUD_COLOR = "white"
+# Profiling: default stats file and number of functions printed when it is written
+PROFILE_OUTPUT = "gameoflife.prof"
+PROFILE_TOP_FUNCTIONS = 25
+
+class SavedState():
+    def __init__(self, cells):
+        self.cells = cells
+
+class UndoHistory():
+    # One entry per generation: [keyframe, births, deaths, edited] where births/deaths
+    # lead to the next generation and keyframe is either None or the full population.
+    # Keyframes are stored periodically and after manual edits, which the deltas don't
+    # capture; edited marks that the previous entry's delta does not lead to this one.
+    def __init__(self, budget=UNDO_HISTORY_BYTES, keyframeInterval=UNDO_KEYFRAME_INTERVAL):
+        self.budget = budget
+        self.keyframeInterval = keyframeInterval
+        self.entries = deque()
+        self.bytes = 0
+        self.edited = True
+        self.sinceKeyframe = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entryBytes(self, entry):
+        keyframe, births, deaths, edited = entry
+        return UNDO_CELL_BYTES * ((len(keyframe) if keyframe is not None else 0) + len(births) + len(deaths))
+
+    def needsKeyframe(self):
+        # whether the next record stores the full population; callers only build it then
+        return self.edited or not self.entries or self.sinceKeyframe >= self.keyframeInterval
+
+    def record(self, before, births, deaths):
+        # before is the population births/deaths lead away from, None unless needsKeyframe()
+        keyframe = None
+        if self.needsKeyframe():
+            keyframe = tuple(before)
+            self.sinceKeyframe = 0
+        self.sinceKeyframe += 1
+        entry = [keyframe, tuple(births), tuple(deaths), self.edited]
+        self.edited = False
+        self.entries.append(entry)
+        self.bytes += self.entryBytes(entry)
+        # evict whole keyframe segments so the oldest entry is always a keyframe
+        while self.bytes > self.budget and self.entries:
+            self.bytes -= self.entryBytes(self.entries.popleft())
+            while self.entries and self.entries[0][0] is None:
+                self.bytes -= self.entryBytes(self.entries.popleft())
+
+    def markEdited(self):
+        self.edited = True
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self.edited = True
+
+    def stepBack(self, current):
+        # Returns the previous generation and the cells removed/added relative to current
+        entry = self.entries.pop()
+        self.bytes -= self.entryBytes(entry)
+        keyframe, births, deaths, edited = entry
+        if keyframe is None and not self.edited:
+            cells = set(current)
+            cells.difference_update(births)
+            cells.update(deaths)
+            removed, added = births, deaths
+        else:
+            if keyframe is None:
+                cells = self.replay()
+            else:
+                cells = set(keyframe)
+            current = set(current)
+            removed, added = current - cells, cells - current
+        self.edited = edited
+        self.sinceKeyframe = 0
+        for entry in reversed(self.entries):
+            self.sinceKeyframe += 1
+            if entry[0] is not None:
+                break
+        return list(cells), removed, added
+
+    def replay(self):
+        # rebuilds the generation after the last entry from the nearest keyframe
+        start = len(self.entries) - 1
+        while self.entries[start][0] is None:
+            start -= 1
+        cells = set(self.entries[start][0])
+        for i in range(start, len(self.entries)):
+            keyframe, births, deaths, edited = self.entries[i]
+            cells.difference_update(deaths)
+            cells.update(births)
+        return cells
+
+def rectDifference(a, b):
+    # the parts of rectangle a outside rectangle b, as at most four rectangles
+    ax0, ay0, ax1, ay1 = a
+    bx0, by0, bx1, by1 = b
+    if bx0 >= ax1 or bx1 <= ax0 or by0 >= ay1 or by1 <= ay0:
+        return [a]
+    parts = []
+    if ax0 < bx0:
+        parts.append((ax0, ay0, bx0, ay1))
+    if bx1 < ax1:
+        parts.append((bx1, ay0, ax1, ay1))
+    mx0, mx1 = max(ax0, bx0), min(ax1, bx1)
+    if ay0 < by0:
+        parts.append((mx0, ay0, mx1, by0))
+    if by1 < ay1:
+        parts.append((mx0, by1, mx1, ay1))
+    return parts
+
+class ViewIndex():
+    # The live cells bucketed into chunks keyed by chunk coordinate, kept up to date
+    # from the births and deaths, so drawing a viewport only visits the chunks it covers.
+    def __init__(self, cells=(), shift=VIEW_CHUNK_SHIFT):
+        self.shift = shift
+        self.chunks = {}
+        self.add(cells)
+
+    def add(self, cells):
+        shift = self.shift
+        chunks = self.chunks
+        for cell in cells:
+            key = (cell[0] >> shift, cell[1] >> shift)
+            try:
+                chunks[key].add(cell)
+            except KeyError:
+                chunks[key] = {cell}
+
+    def remove(self, cells):
+        shift = self.shift
+        chunks = self.chunks
+        for cell in cells:
+            key = (cell[0] >> shift, cell[1] >> shift)
+            chunk = chunks.get(key)
+            if chunk is not None:
+                chunk.discard(cell)
+                if not chunk:
+                    del chunks[key]
+
+    def __iter__(self):
+        for chunk in self.chunks.values():
+            yield from chunk
+
+    def __contains__(self, cell):
+        chunk = self.chunks.get((cell[0] >> self.shift, cell[1] >> self.shift))
+        return chunk is not None and cell in chunk
+
+    def query(self, x0, y0, x1, y1):
+        # live cells with x0 <= x < x1 and y0 <= y < y1
+        shift = self.shift
+        size = 1 << shift
+        found = []
+        for cx in range(x0 >> shift, ((x1 - 1) >> shift) + 1):
+            for cy in range(y0 >> shift, ((y1 - 1) >> shift) + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                if cx << shift >= x0 and (cx << shift) + size <= x1 and cy << shift >= y0 and (cy << shift) + size <= y1:
+                    found.extend(chunk)
+                else:
+                    found.extend(cell for cell in chunk if x0 <= cell[0] < x1 and y0 <= cell[1] < y1)
+        return found
+
+class DensityPyramid():
+    # Live cell counts of the aligned 2^k x 2^k blocks for every level k from 1 up, kept
+    # up to date from the births and deaths so a zoomed out view reads one count per pixel.
+    def __init__(self, cells=(), levels=DENSITY_PYRAMID_LEVELS):
+        # levels[k] maps block coordinates to counts; level 0 would be the cells themselves
+        self.levels = [None, dict(Counter((x >> 1, y >> 1) for x, y in cells))]
+        for k in range(1, levels):
+            coarser = {}
+            for (x, y), count in self.levels[k].items():
+                key = (x >> 1, y >> 1)
+                coarser[key] = coarser.get(key, 0) + count
+            self.levels.append(coarser)
+
+    def update(self, born, died):
+        delta = Counter((x >> 1, y >> 1) for x, y in born)
+        delta.subtract((x >> 1, y >> 1) for x, y in died)
+        for counts in self.levels[1:]:
+            coarser = {}
+            for key, change in delta.items():
+                if not change:
+                    continue
+                count = counts.get(key, 0) + change
+                if count:
+                    counts[key] = count
+                else:
+                    del counts[key]
+                parent = (key[0] >> 1, key[1] >> 1)
+                coarser[parent] = coarser.get(parent, 0) + change
+            delta = coarser
+
+    def query(self, level, x0, y0, x1, y1):
+        # occupied blocks of the level with x0 <= x < x1 and y0 <= y < y1 as (x, y, count),
+        # found by descending from a level where the rectangle spans only a few blocks,
+        # or by a plain scan when the level is small next to the rectangle
+        counts = self.levels[level]
+        if len(counts) <= DENSITY_SCAN_RATIO * (x1 - x0) * (y1 - y0):
+            return [(x, y, count) for (x, y), count in counts.items() if x0 <= x < x1 and y0 <= y < y1]
+        top = min(len(self.levels) - 1, level + max((x1 - x0).bit_length(), (y1 - y0).bit_length()))
+        shift = top - level
+        counts = self.levels[top]
+        found = [(x, y) for x in range(x0 >> shift, ((x1 - 1) >> shift) + 1) for y in range(y0 >> shift, ((y1 - 1) >> shift) + 1) if (x, y) in counts]
+        for counts in self.levels[top - 1:level - 1:-1]:
+            shift -= 1
+            lx0, ly0, lx1, ly1 = x0 >> shift, y0 >> shift, (x1 - 1) >> shift, (y1 - 1) >> shift
+            children = []
+            for x, y in found:
+                x *= 2
+                y *= 2
+                for child in ((x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)):
+                    if child in counts:
+                        children.append(child)
+            found = [(x, y) for x, y in children if lx0 <= x <= lx1 and ly0 <= y <= ly1]
+        return [(x, y, counts[x, y]) for x, y in found]
+
+class PerfStats():
+    # Time spent per phase and canvas items created/deleted since the last snapshot.
+    # Phases are added from both threads, so they are kept under a lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = dict.fromkeys(PERF_PHASES, 0.0)
+        self.generations = 0
+        self.itemsCreated = 0
+        self.itemsDeleted = 0
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.times[phase] += seconds
+
+    def addGeneration(self, step, undo, index, cycle):
+        with self.lock:
+            times = self.times
+            times["step"] += step
+            times["undo"] += undo
+            times["index"] += index
+            times["cycle"] += cycle
+            self.generations += 1
+
+    def snapshot(self):
+        with self.lock:
+            times, generations = self.times, self.generations
+            self.times, self.generations = dict.fromkeys(PERF_PHASES, 0.0), 0
+        created, deleted = self.itemsCreated, self.itemsDeleted
+        self.itemsCreated = self.itemsDeleted = 0
+        record = {f"{phase}_ms": round(seconds * 1000, 3) for phase, seconds in times.items()}
+        record.update(generations=generations, items_created=created, items_deleted=deleted)
+        return record
+
+class CountingCells():
+    # Wraps the population handed to saveCells and counts how much of it was written
+    def __init__(self, cells):
+        self.cells = cells
+        self.done = 0
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        for cell in self.cells:
+            self.done += 1
+            yield cell
+
+class FileTask(threading.Thread):
+    # Loads or saves a state file on its own thread, so neither the window nor the
+    # simulation waits on the disk. The Tk thread polls progress every frame. A load
+    # can be cancelled between chunks and its cells are only handed over, in one
+    # swap, once the whole file parsed.
+    def __init__(self, filename, cells=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.filename = filename
+        self.loading = cells is None
+        self.cells = CountingCells(cells) if cells is not None else None
+        self.progress = 0.0
+        self.origin = None
+        self.error = None
+        self.cancelled = threading.Event()
+
+    def run(self):
+        try:
+            if self.loading:
+                self.load()
+            else:
+                saveCells(self.filename, self.cells)
+        except Exception as e:
+            # anything a bad file can raise (UnicodeDecodeError, zlib.error, ...) is
+            # reported to the user instead of ending the thread with no cells and no error
+            self.error = e
+
+    def load(self):
+        cells = []
+        for chunk, self.progress in iterCellChunks(self.filename):
+            if self.cancelled.is_set():
+                return
+            cells.extend(chunk)
+        if cells:
+            self.origin = (min(cell[0] for cell in cells), min(cell[1] for cell in cells))
+        self.cells = cells
+
+    def status(self):
+        if self.loading:
+            return f"Loading {os.path.basename(self.filename)}: {self.progress:.0%}"
+        progress = self.cells.done / len(self.cells) if len(self.cells) else 1.0
+        return f"Saving {os.path.basename(self.filename)}: {progress:.0%}"
+
+class SimulationWorker(threading.Thread):
+    # Steps the simulation off the Tk thread at the selected speed. Everything that
+    # touches the game state is submitted here as a callable, so clicks, loads and
+    # generations never interleave.
+    def __init__(self, app):
+        threading.Thread.__init__(self, daemon=True)
+        self.app = app
+        self.tasks = queue.Queue()
+        self.stopped = False
+
+    def submit(self, task):
+        self.tasks.put(task)
+
+    def stop(self):
+        self.stopped = True
+        self.tasks.put(None)
+
+    def runTask(self, task):
+        if task is None:
+            return
+        try:
+            task()
+        except Exception:
+            traceback.print_exc()
+
+    def run(self):
+        nextStep = perf_counter()
+        while not self.stopped:
+            app = self.app
+            if not app.gamestate.running:
+                self.runTask(self.tasks.get())
+                nextStep = perf_counter()
+                continue
+            now = perf_counter()
+            if now < nextStep:
+                try:
+                    self.runTask(self.tasks.get(timeout=nextStep - now))
+                except queue.Empty:
+                    pass
+                continue
+            try:
+                while True:
+                    self.runTask(self.tasks.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                app.updateStep()
+            except Exception as e:
+                # a failed generation pauses the simulation instead of ending the worker
+                traceback.print_exc()
+                app.gamestate.running = False
+                with app.stateLock:
+                    app.stepError = e
+                continue
+            nextStep = now + UPDATE_FREQS[app.update_freq_idx] / 1000
+
+class Application(tk.Frame):
+    def __init__(self, master=None, engine=DEFAULT_ENGINE, renderer=DEFAULT_RENDERER, workers=None, tileSize=PARALLEL_TILE_SIZE):
+        tk.Frame.__init__(self, master)
+        self.grid(padx=5, pady=5)
+
+        self.cellsize = 3
+        self.brushOffsets = None # per orientation, None for the default brush
+        self.brushOrientation = 0
+        self.brushsize = 1
+        self.cell_rectangles = {}
+        self.raster = renderer == "raster"
+        self.rasterImage = None
+        self.blitPending = False
+        # empty grids by (cellsize, width, height), oldest first
+        self.gridImages = {}
+        self.gridPhotos = {}
+        self.gamestate = createEngine(engine, workers, tileSize)
+        self.lastSavedState = None
+        self.undoHistory = UndoHistory()
+        self.cycleDetector = CycleDetector()
+        self.stopOnCycle = False
+        # changes made by the worker since the last frame, guarded by stateLock
+        self.stateLock = threading.RLock()
+        self.pendingBorn = set()
+        self.pendingDied = set()
+        self.pendingRefresh = False
+        # the exception of a generation that failed on the worker, until it is shown
+        self.stepError = None
+        self.viewIndex = ViewIndex()
+        # below the smallest cell size a pixel covers 1 << densityShift cells per side,
+        # counted by densityPyramid; both are None at normal zoom
+        self.densityShift = None
+        self.densityPyramid = None
+        self.perfStats = PerfStats()
+        self.showHud = False
+        self.metricsFile = None
+        self.lastFrame = perf_counter()
+        self.lastDraw = 0.0
+        # milliseconds per generation in each worker phase, kept from the last frame that had any
+        self.generationTimes = dict.fromkeys(PERF_PHASES[:4], 0.0)
+        # cProfile of the worker and of the Tk thread while profileRemaining > 0
+        self.stepProfile = None
+        self.drawProfile = None
+        self.profileRemaining = 0
+        self.profileOutput = PROFILE_OUTPUT
+        self.fileTask = None
+
+        self.viewOffset = (0, 0)
+        # cells in view as (x0, y0, x1, y1), set by every full redraw
+        self.viewRect = (0, 0, 0, 0)
+
+        self.update_freq_idx = 0
+        self.stepExponent = 0
+        self.lastZoom = 0
+
+        self.showingRulesPopup = False
+
+        self.master.protocol("WM_DELETE_WINDOW", self.quit)
+        self.createWidgets()
+        self.refreshView()
+        self.worker = SimulationWorker(self)
+        self.worker.start()
+
+    def shutdown(self):
+        # Called once mainloop returns: the worker finishes its current task, then the
+        # engine releases what it holds (the parallel engine's pool and shared memory).
+        self.worker.stop()
+        self.worker.join()
+        self.gamestate.close()
+        if self.metricsFile is not None:
+            self.metricsFile.close()
+            self.metricsFile = None
+
+    ### Update ###
+    # updateStep and the other state changes below run on the worker thread and only
+    # queue their effect on the canvas; renderLoop draws it on the Tk thread.
+    def updateStep(self):
+        profiling = self.profileRemaining > 0
+        if profiling:
+            self.stepProfile.enable()
+        # Only this thread touches the engine, so the generation is computed without the
+        # lock; stateLock is taken just to publish it to what the Tk thread reads.
+        start = perf_counter()
+        # most generations are stored as births/deaths only, so the whole population
+        # is listed just for keyframes
+        before = self.gamestate.cells if self.undoHistory.needsKeyframe() else None
+        copied = perf_counter()
+        self.gamestate.updateCells()
+        stepped = perf_counter()
+        born, died = self.gamestate.new_cells, self.gamestate.dead_cells
+        self.undoHistory.record(before, born, died)
+        recorded = perf_counter()
+        with self.stateLock:
+            self.queueChanges(born, died)
+            queued = perf_counter()
+            if self.cycleDetector.record(self.gamestate, self.gamestate.stepSize if self.canJumpSteps() else 1) and self.stopOnCycle:
+                self.gamestate.running = False
+            self.perfStats.addGeneration(stepped - copied, copied - start + recorded - stepped, queued - recorded, perf_counter() - queued)
+        if profiling:
+            self.stepProfile.disable()
+            self.profileRemaining -= 1
+
+    def queueChanges(self, born, died):
+        # only changes inside the view are queued for drawing, the rest wait in
+        # viewIndex until a redraw brings them into view
+        with self.stateLock:
+            self.viewIndex.remove(died)
+            self.viewIndex.add(born)
+            if self.densityPyramid is not None:
+                self.densityPyramid.update(born, died)
+            x0, y0, x1, y1 = self.viewRect
+            for cell in died:
+                if not (x0 <= cell[0] < x1 and y0 <= cell[1] < y1):
+                    continue
+                if cell in self.pendingBorn:
+                    self.pendingBorn.discard(cell)
+                else:
+                    self.pendingDied.add(cell)
+            for cell in born:
+                if not (x0 <= cell[0] < x1 and y0 <= cell[1] < y1):
+                    continue
+                if cell in self.pendingDied:
+                    self.pendingDied.discard(cell)
+                else:
+                    self.pendingBorn.add(cell)
+
+    def queueRefresh(self):
+        with self.stateLock:
+            self.viewIndex = ViewIndex(self.gamestate.cells)
+            if self.densityPyramid is not None:
+                self.densityPyramid = DensityPyramid(self.gamestate.cells)
+            self.pendingRefresh = True
+
+    def renderLoop(self):
+        # draws the latest finished generation, skipping any in between
+        self.after(int(1000 / FPS), self.renderLoop)
+        start = perf_counter()
+        profiling = self.drawProfile is not None
+        if profiling:
+            self.drawProfile.enable()
+        with self.stateLock:
+            born, died, refresh = self.pendingBorn, self.pendingDied, self.pendingRefresh
+            self.pendingBorn, self.pendingDied, self.pendingRefresh = set(), set(), False
+        if refresh:
+            self.refreshView()
+        elif self.densityShift is not None:
+            self.paintDensity(born | died)
+        else:
+            self.removeDeadCells(died)
+            self.addNewCells(born)
+        self.updateSkippedLabel()
+        self.updateCycleLabel()
+        self.updateFileProgress()
+        self.updateStepError()
+        if profiling:
+            self.drawProfile.disable()
+            if self.profileRemaining <= 0:
+                self.dumpProfile()
+        self.perfStats.add("draw", perf_counter() - start)
+        if self.showHud or self.metricsFile is not None:
+            self.reportFrame(start)
+
+    ### Instrumentation ###
+    def reportFrame(self, start):
+        # one record per frame with what happened since the previous one; tk_ms is how
+        # late the frame timer fired beyond our own drawing, i.e. time spent inside Tk
+        record = self.perfStats.snapshot()
+        frameMs = (start - self.lastFrame) * 1000
+        record["frame_ms"] = round(frameMs, 3)
+        record["tk_ms"] = round(max(0.0, frameMs - 1000 / FPS - self.lastDraw), 3)
+        self.lastFrame = start
+        self.lastDraw = record["draw_ms"]
+        with self.stateLock:
+            record["generation"] = self.cycleDetector.generation
+            record["population"] = self.cycleDetector.population
+            record["undo_bytes"] = self.undoHistory.bytes
+        # besides the cell rectangles the canvas holds one image (the grid or the raster)
+        # and, while shown, the overlay text; find_all() would list every item
+        record["canvas_items"] = len(self.cell_rectangles) + 1 + (1 if self.showHud else 0)
+        if record["generations"]:
+            self.generationTimes = {phase: record[f"{phase}_ms"] / record["generations"] for phase in self.generationTimes}
+        if self.metricsFile is not None:
+            record["time"] = round(time(), 3)
+            self.metricsFile.write(json.dumps(record) + "\n")
+        if self.showHud:
+            self.drawHud(record)
+
+    def drawHud(self, record):
+        times = self.generationTimes
+        lines = [
+            f"generation {record['generation']}  population {record['population']}",
+            f"{sum(times.values()):.1f} ms/generation, {record['generations']} this frame",
+            f"step {times['step']:.1f}  undo {times['undo']:.1f}  index {times['index']:.1f}  cycle {times['cycle']:.1f} ms",
+            f"draw {record['draw_ms']:.1f}  tk {record['tk_ms']:.1f}  frame {record['frame_ms']:.1f} ms",
+            f"canvas items {record['canvas_items']}  +{record['items_created']} -{record['items_deleted']}",
+            f"undo memory {record['undo_bytes'] / 2**20:.1f} MiB",
+        ]
+        self.canvas.delete(HUD_TAG)
+        self.canvas.create_text(8, 8, text="\n".join(lines), anchor=tk.NW, fill=HUD_COLOR, font="TkFixedFont", tags=HUD_TAG)
+
+    def toggleHud(self):
+        self.showHud = self.hudVar.get()
+        if not self.showHud:
+            self.canvas.delete(HUD_TAG)
+
+    def openMetrics(self, path):
+        # line buffered so the file can be followed while the application runs
+        self.metricsFile = open(path, "w", buffering=1)
+
+    def startProfile(self, generations, path=PROFILE_OUTPUT):
+        # profiles the next generations on the worker and the frames drawn meanwhile,
+        # then writes the combined stats to path and prints the most expensive calls
+        self.stepProfile = cProfile.Profile()
+        self.drawProfile = cProfile.Profile()
+        self.profileOutput = path
+        self.profileRemaining = generations
+
+    def dumpProfile(self):
+        stats = pstats.Stats(self.stepProfile)
+        stats.add(self.drawProfile)
+        self.stepProfile = self.drawProfile = None
+        stats.dump_stats(self.profileOutput)
+        print(f"Profile written to {self.profileOutput}")
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+
+    def visibleCells(self):
+        # the live cells in view for a full redraw; pending changes are already part of it
+        with self.stateLock:
+            self.pendingBorn, self.pendingDied = set(), set()
+            return self.viewIndex.query(*self.viewRect)
+
+    def updateViewRect(self):
+        x0, y0 = -self.viewOffset[0], -self.viewOffset[1]
+        if self.densityShift is not None:
+            self.viewRect = (x0, y0, x0 + (self.canvas.winfo_width() << self.densityShift), y0 + (self.canvas.winfo_height() << self.densityShift))
+            return
+        self.viewRect = (x0, y0, x0 + self.canvas.winfo_width() // self.cellsize + 1, y0 + self.canvas.winfo_height() // self.cellsize + 1)
+
+    ### Input ###
+    def leftClick(self, cell):
+        if self.brushOffsets is None:
+            cells = []
+            if self.brushsize == 1:
+                cells.append(cell)
+            else:
+                halfbs = math.ceil(self.brushsize / 2)
+                for i in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
+                    for j in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
+                        cells.append((cell[0] + i, cell[1] + j))
+        else:
+            x, y = cell
+            cells = [(x + dx, y + dy) for dx, dy in self.brushOffsets[self.brushOrientation]]
+        self.worker.submit(lambda: self.interfaceAddCells(cells))
+
+    def leftClickedCanvasCallback(self, event):
+        if self.densityShift is not None: return
+        i = math.floor(event.x / self.cellsize) - self.viewOffset[0]
+        j = math.floor(event.y / self.cellsize) - self.viewOffset[1]
+        self.leftClick((i, j))
+
+    def deleteCells(self, cells):
+        with self.stateLock:
+            removed = self.gamestate.removeCells(cells)
+            if removed:
+                self.undoHistory.markEdited()
+                self.cycleDetector.edit([], removed)
+                self.queueChanges([], removed)
+
+    def rightClick(self, cell):
+        cells = []
+        if self.brushsize == 1:
+            cells.append(cell)
+        else:
+            halfbs = math.ceil(self.brushsize / 2)
+            for i in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
+                for j in range(-halfbs + (1 if self.brushsize % 2 else 0), halfbs):
+                    cells.append((cell[0] + i, cell[1] + j))
+        self.worker.submit(lambda: self.deleteCells(cells))
+
+    def rightClickedCanvasCallback(self, event):
+        if self.densityShift is not None: return
+        i = math.floor(event.x / self.cellsize) - self.viewOffset[0]
+        j = math.floor(event.y / self.cellsize) - self.viewOffset[1]
+        cell = (i, j)
+        self.rightClick(cell)
+
+    def zoomLocation(self, event, cellsize, densityShift=None):
+        cx = int(self.canvas.winfo_width()  / 2)
+        cy = int(self.canvas.winfo_height() / 2)
+        if densityShift is None:
+            return (int((cx - event.x) / cellsize + self.viewOffset[0]), int((cy - event.y) / cellsize) + self.viewOffset[1])
+        # density views keep the offset on a block boundary so every pixel covers whole blocks
+        x = ((cx - event.x) << densityShift) + self.viewOffset[0]
+        y = ((cy - event.y) << densityShift) + self.viewOffset[1]
+        return ((x >> densityShift) << densityShift, (y >> densityShift) << densityShift)
+
+    def zoomIn(self, event):
+        now = time()
+        if self.densityShift is None and self.cellsize >= MAX_CELLSIZE or now - self.lastZoom < ZOOM_FREQ: return
+        self.lastZoom = now
+        if self.densityShift == 0:
+            self.moveView(self.zoomLocation(event, self.cellsize), self.cellsize, "Zoom")
+        elif self.densityShift is not None:
+            self.moveView(self.zoomLocation(event, self.cellsize, self.densityShift - 1), self.cellsize, "Zoom", self.densityShift - 1)
+        else:
+            self.moveView(self.zoomLocation(event, self.cellsize + 1), self.cellsize + 1, "Zoom")
+
+    def zoomOut(self, event):
+        now = time()
+        if self.densityShift == DENSITY_MAX_SHIFT or now - self.lastZoom < ZOOM_FREQ: return
+        self.lastZoom = now
+        if self.densityShift is not None:
+            self.moveView(self.zoomLocation(event, self.cellsize, self.densityShift + 1), self.cellsize, "Zoom", self.densityShift + 1)
+        elif self.cellsize <= 2:
+            # past the smallest cell size the view turns into a density map
+            self.moveView(self.zoomLocation(event, self.cellsize, 0), self.cellsize, "Zoom", 0)
+        else:
+            self.moveView(self.zoomLocation(event, self.cellsize - 1), self.cellsize - 1, "Zoom")
+
+    def handleKey(self, event):
+        step = 1 if self.densityShift is None else DENSITY_PAN_PIXELS << self.densityShift
+        if   event.keycode in [111, 25]: # Up
+            viewOffset = (self.viewOffset[0], self.viewOffset[1] + step)
+        elif event.keycode in [113, 38]: # Left
+            viewOffset = (self.viewOffset[0] + step, self.viewOffset[1])
+        elif event.keycode in [114, 40]: # Right
+            viewOffset = (self.viewOffset[0] - step, self.viewOffset[1])
+        elif event.keycode in [116, 39]: # Down
+            viewOffset = (self.viewOffset[0], self.viewOffset[1] - step)
+        else:
+            #print(event.keycode)
+            return
+        self.moveView(viewOffset, self.cellsize, "Pan", self.densityShift)
+
+    def toggleGameUpdates(self):
+        def toggle():
+            self.gamestate.running = not self.gamestate.running
+        self.worker.submit(toggle)
+
+    def saveState(self):
+        self.worker.submit(lambda: setattr(self, "lastSavedState", SavedState(list(self.gamestate.cells))))
+
+    def saveStateToFile(self):
+        if self.fileBusy(): return
+        filename = filedialog.asksaveasfilename(initialdir=__file__, title="Select state file", filetypes=STATE_FILETYPES)
+        if filename:
+            # the population is copied on the worker, between generations
+            self.worker.submit(lambda: self.startFileTask(FileTask(filename, list(self.gamestate.cells))))
+
+    def replaceCells(self, cells):
+        with self.stateLock:
+            self.gamestate.cells = cells
+            self.undoHistory.markEdited()
+            self.cycleDetector.reset(cells)
+            self.queueRefresh()
+
+    def loadStateFromFile(self):
+        if self.fileBusy(): return
+        filename = filedialog.askopenfilename(initialdir=__file__, title="Select state file", filetypes=STATE_FILETYPES)
+        if filename:
+            self.startFileTask(FileTask(filename))
+
+    def fileBusy(self):
+        if self.fileTask is not None:
+            showerror(title="File busy", message="Wait for the current load or save to finish, or cancel it")
+            return True
+        return False
+
+    def startFileTask(self, task):
+        self.fileTask = task
+        task.start()
+
+    def updateStepError(self):
+        with self.stateLock:
+            error, self.stepError = self.stepError, None
+        if error is not None:
+            showerror(title="Simulation error", message=f"The simulation was paused, the last generation failed: {error!r}")
+
+    def cancelLoad(self):
+        task = self.fileTask
+        if task is not None and task.loading:
+            task.cancelled.set()
+
+    def updateFileProgress(self):
+        task = self.fileTask
+        if task is None:
+            return
+        if task.is_alive():
+            self.fileStringVar.set(task.status() + (" (cancelling)" if task.cancelled.is_set() else ""))
+            return
+        self.fileTask = None
+        self.fileStringVar.set("")
+        if task.error is not None:
+            showerror(title="Load error" if task.loading else "Save error", message=str(task.error))
+        elif task.loading and not task.cancelled.is_set() and task.cells is not None:
+            cells = task.cells
+            if task.origin is not None:
+                self.viewOffset = (-task.origin[0], -task.origin[1])
+                if self.densityShift is not None:
+                    shift = self.densityShift
+                    self.viewOffset = ((self.viewOffset[0] >> shift) << shift, (self.viewOffset[1] >> shift) << shift)
+            self.worker.submit(lambda: self.replaceCells(cells))
+
+    def loadState(self):
+        def load():
+            if self.lastSavedState:
+                self.replaceCells(list(self.lastSavedState.cells))
+        self.worker.submit(load)
+
+    def clearState(self):
+        self.worker.submit(lambda: self.replaceCells([]))
+
+    def manualStep(self):
+        self.worker.submit(self.updateStep)
+
+    def manualStepBack(self):
+        def stepBack():
+            with self.stateLock:
+                if len(self.undoHistory) > 0:
+                    cells, removed, added = self.undoHistory.stepBack(self.gamestate.cells)
+                    self.gamestate.cells = cells
+                    self.cycleDetector.edit(added, removed, self.cycleDetector.generation - 1)
+                    self.queueChanges(added, removed)
+        self.worker.submit(stepBack)
+
+    def toggleStopOnCycle(self):
+        self.stopOnCycle = self.stopOnCycleVar.get()
+
+    def skipAhead(self):
+        # a periodic population can jump to any later generation without simulating it
+        if self.cycleDetector.period is None:
+            showerror(title="Skip ahead", message="No cycle found yet, let the simulation run until it repeats.")
+            return
+        current = self.cycleDetector.generation
+        target = askinteger("Skip ahead", f"Skip from generation {current} to:", initialvalue=current * 10, minvalue=current)
+        if target is None:
+            return
+        def skip():
+            with self.stateLock:
+                if self.cycleDetector.period is not None and target > self.cycleDetector.generation:
+                    self.cycleDetector.fastForward(self.gamestate, target - self.cycleDetector.generation)
+                    self.undoHistory.markEdited()
+                    self.queueRefresh()
+        self.worker.submit(skip)
+
+    def updateCycleLabel(self):
+        detector = self.cycleDetector
+        with self.stateLock:
+            generation, period, displacement = detector.generation, detector.period, detector.displacement
+        if period is None:
+            self.cycleStringVar.set(f"Generation {generation}")
+        elif displacement == (0, 0):
+            self.cycleStringVar.set(f"Generation {generation}, repeats every {period}")
+        else:
+            self.cycleStringVar.set(f"Generation {generation}, repeats every {period} moving {displacement}")
+
+    def updateSkippedLabel(self):
+        if isinstance(self.gamestate, ActiveRegionGameState):
+            self.skippedStringVar.set(f"Skipped: {self.gamestate.skippedFraction:.0%} of chunks")
+
+    def updateSpeedLabel(self):
+        if self.stepExponent:
+            self.speedStringVar.set(f"Speed: x{self.update_freq_idx + 1}, step {2**self.stepExponent}")
+        else:
+            self.speedStringVar.set(f"Speed: x{self.update_freq_idx + 1}")
+
+    def canJumpSteps(self):
+        return isinstance(self.gamestate, HashLifeGameState)
+
+    def increaseSpeed(self):
+        if self.update_freq_idx >= len(UPDATE_FREQS)-1:
+            # past the fastest tick rate HashLife keeps going in power-of-two steps
+            if not self.canJumpSteps() or self.stepExponent >= HASHLIFE_MAX_STEP_EXPONENT: return
+            self.stepExponent += 1
+            self.gamestate.stepSize = 2**self.stepExponent
+        else:
+            self.update_freq_idx += 1
+        self.updateSpeedLabel()
+
+    def decreaseSpeed(self):
+        if self.stepExponent > 0:
+            self.stepExponent -= 1
+            self.gamestate.stepSize = 2**self.stepExponent
+        elif self.update_freq_idx <= 0: return
+        else:
+            self.update_freq_idx -= 1
+        self.updateSpeedLabel()
+
+    def updateBrushSizeLabel(self):
+        self.brushSizeVar.set(f"Brush size: {self.brushsize}")
+
+    def increaseBrushSize(self):
+        if self.brushsize >= 9: return
+        self.brushsize += 1
+        self.updateBrushSizeLabel()
+
+    def decreaseBrushSize(self):
+        if self.brushsize <= 1: return
+        self.brushsize -= 1
+        self.updateBrushSizeLabel()
+
+    def updateBrushRotLabel(self):
+        # orientations 4-7 are 0-3 applied after a mirror, see ORIENTATIONS
+        mirrored = ", mirrored" if self.brushOrientation & 4 else ""
+        self.brushRotVar.set(f"Brush rotation: {90 * (self.brushOrientation & 3)}{mirrored}")
+
+    def rotateBrushLeft(self):
+        if self.brushOffsets is None: return
+        self.brushOrientation = (self.brushOrientation & 4) | ((self.brushOrientation - 1) & 3)
+        self.updateBrushRotLabel()
+
+    def rotateBrushRight(self):
+        if self.brushOffsets is None: return
+        self.brushOrientation = (self.brushOrientation & 4) | ((self.brushOrientation + 1) & 3)
+        self.updateBrushRotLabel()
+
+    def mirrorBrush(self):
+        if self.brushOffsets is None: return
+        # mirroring after k clockwise turns is the same as k anticlockwise turns after a mirror
+        self.brushOrientation = ((self.brushOrientation & 4) ^ 4) | (-self.brushOrientation & 3)
+        self.updateBrushRotLabel()
+
+    def selectBrush(self, brush):
+        # brush is a BrushType or the path of an imported pattern file; the brush is
+        # compiled (or read from the brush cache) the first time it is picked
+        offsets = None
+        if brush is not BrushType.default:
+            path = brushPath(brush) if isinstance(brush, BrushType) else brush
+            try:
+                offsets = brushOrientations(path)
+            except (OSError, ImportError, StateFileError) as e:
+                showerror(title="Brush error", message=f"Could not load brush {path}: {e}")
+                return False
+        self.brushOffsets = offsets
+        self.brushOrientation = 0
+        self.updateBrushRotLabel()
+        return True
+
+    def importBrush(self):
+        filename = filedialog.askopenfilename(initialdir=__file__, title="Select pattern file", filetypes=STATE_FILETYPES)
+        if not filename: return
+        filename = os.path.abspath(filename)
+        if self.selectBrush(filename) and filename not in self.importedBrushPaths:
+            self.addImportedBrushButton(filename)
+
+    def addImportedBrushButton(self, path):
+        self.importedBrushPaths.add(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        button = tk.Button(self.importedBrushFrame, text=name, command=lambda: self.selectBrush(path), width=12)
+        button.grid(row=len(self.importedBrushPaths), column=0, columnspan=2, sticky="W")
+
+    def updateRules(self):
+        rule = self.ruleStringVar.get()
+        try:
+            parseRule(rule)
+        except ValueError as e:
+            showerror(title="Rules of life", message=str(e))
+            return
+        self.worker.submit(lambda: self.gamestate.setRule(rule))
+
+    def thresholdsChanged(self, *args):
+        # the three numbers are a shorthand for a rulestring, keep that in step
+        try:
+            rule = thresholdRule(int(self.underpopulationStringVar.get()), int(self.overpopulationStringVar.get()), int(self.rebornStringVar.get()))
+            parseRule(rule)
+        except ValueError:
+            return
+        self.ruleStringVar.set(rule)
+
+    def quitRulesPopup(self):
+        self.showingRulesPopup = False
+        self.rulesPopup.destroy()
+
+    def setAutomataRulesPopup(self):
+        if self.showingRulesPopup: return
+        self.showingRulesPopup = True
+        self.rulesPopup = tk.Toplevel(padx=10, pady=10)
+        self.rulesPopup.attributes('-topmost', 'true')
+        self.rulesPopup.protocol("WM_DELETE_WINDOW", self.quitRulesPopup)
+
+        header = tk.Label(self.rulesPopup, text="These are the rules of life:", font='Helvetica 14 bold')
+        header.grid(row=0, column=0, sticky="W")
+
+        rulesMainFrame = tk.Frame(self.rulesPopup)
+        rulesMainFrame.grid(row=1, column=0, pady=5)
+        # rules with more than one birth count or gaps in the survival counts only fit the rulestring
+        born, survive = parseRule(self.gamestate.rule)
+        ranges = ruleRanges(survive)
+        thresholds = (ranges[0][0], ranges[0][1], born[0]) if len(born) == 1 and len(ranges) == 1 else ("", "", "")
+        label1 = tk.Label(rulesMainFrame, text="A live cell dies by underpopulation when it has fewer than")
+        label1.grid(row=0, column=0, sticky="E")
+        self.underpopulationStringVar = tk.StringVar()
+        self.underpopulationStringVar.set(str(thresholds[0]))
+        underpopulationEntry = tk.Entry(rulesMainFrame, textvariable=self.underpopulationStringVar, justify=tk.CENTER, width=10)
+        underpopulationEntry.grid(row=0, column=1, padx=5)
+        label2 = tk.Label(rulesMainFrame, text="neighbours.")
+        label2.grid(row=0, column=2)
+
+        label1 = tk.Label(rulesMainFrame, text="A live cell dies by overpopulation when it has more than")
+        label1.grid(row=1, column=0, sticky="E")
+        self.overpopulationStringVar = tk.StringVar()
+        self.overpopulationStringVar.set(str(thresholds[1]))
+        overpopulationEntry = tk.Entry(rulesMainFrame, textvariable=self.overpopulationStringVar, justify=tk.CENTER, width=10)
+        overpopulationEntry.grid(row=1, column=1, padx=5)
+        label2 = tk.Label(rulesMainFrame, text="neighbours.")
+        label2.grid(row=1, column=2)
+
+        label1 = tk.Label(rulesMainFrame, text="A dead cell is reborn when it has exactly ")
+        label1.grid(row=2, column=0, sticky="E")
+        self.rebornStringVar = tk.StringVar()
+        self.rebornStringVar.set(str(thresholds[2]))
+        rebornEntry = tk.Entry(rulesMainFrame, textvariable=self.rebornStringVar, justify=tk.CENTER, width=10)
+        rebornEntry.grid(row=2, column=1, padx=5)
+        label2 = tk.Label(rulesMainFrame, text="neighbours.")
+        label2.grid(row=2, column=2)
+
+        label1 = tk.Label(rulesMainFrame, text="Or any rulestring, such as B36/S23:")
+        label1.grid(row=3, column=0, sticky="E")
+        self.ruleStringVar = tk.StringVar()
+        self.ruleStringVar.set(self.gamestate.rule)
+        ruleEntry = tk.Entry(rulesMainFrame, textvariable=self.ruleStringVar, justify=tk.CENTER, width=10)
+        ruleEntry.grid(row=3, column=1, padx=5)
+        for var in (self.underpopulationStringVar, self.overpopulationStringVar, self.rebornStringVar):
+            var.trace_add("write", self.thresholdsChanged)
+
+        updateRulesButton = tk.Button(self.rulesPopup, text='Update rules', command=self.updateRules, width=10)
+        updateRulesButton.grid(row=2, column=0, sticky="E")
+
+    ### Init ###
+    def createTopFrame(self):
+        quitButton = tk.Button(self, text='Quit', command=self.quit, width=10)
+        quitButton.grid(row=0, column=0, sticky="NW")
+
+        setRulesButton = tk.Button(self, text='Rules of life', command=self.setAutomataRulesPopup, width=10)
+        setRulesButton.grid(row=0, column=1, sticky="N")
+
+        gameControlFrame = tk.Frame(self)
+        gameControlFrame.grid(row=0, column=2, sticky="NE")
+        startButton = tk.Button(gameControlFrame, text='Start/Pause', command=self.toggleGameUpdates, width=10)
+        startButton.grid(row=0, column=0)
+        stepButton = tk.Button(gameControlFrame, text='Step', command=self.manualStep, width=10)
+        stepButton.grid(row=0, column=1)
+        stepBackButton = tk.Button(gameControlFrame, text='Step back', command=self.manualStepBack, width=10)
+        stepBackButton.grid(row=0, column=2)
+        self.speedStringVar = tk.StringVar()
+        self.updateSpeedLabel()
+        speedLabel = tk.Label(gameControlFrame, textvariable=self.speedStringVar)
+        speedLabel.grid(row=1, column=0)
+        speedDecreaseButton = tk.Button(gameControlFrame, text='Slower', command=self.decreaseSpeed, width=10)
+        speedDecreaseButton.grid(row=1, column=1)
+        speedIncreaseButton = tk.Button(gameControlFrame, text='Faster', command=self.increaseSpeed, width=10)
+        speedIncreaseButton.grid(row=1, column=2)
+        self.skippedStringVar = tk.StringVar()
+        skippedLabel = tk.Label(gameControlFrame, textvariable=self.skippedStringVar)
+        skippedLabel.grid(row=2, column=0, columnspan=3)
+        self.cycleStringVar = tk.StringVar()
+        cycleLabel = tk.Label(gameControlFrame, textvariable=self.cycleStringVar)
+        cycleLabel.grid(row=3, column=0, columnspan=3)
+        self.stopOnCycleVar = tk.BooleanVar()
+        stopOnCycleButton = tk.Checkbutton(gameControlFrame, text='Stop on cycle', variable=self.stopOnCycleVar, command=self.toggleStopOnCycle)
+        stopOnCycleButton.grid(row=4, column=1)
+        skipAheadButton = tk.Button(gameControlFrame, text='Skip ahead', command=self.skipAhead, width=10)
+        skipAheadButton.grid(row=4, column=2)
+
+        stateControlFrame = tk.Frame(self)
+        stateControlFrame.grid(row=0, column=3, sticky="E")
+        saveButton = tk.Button(stateControlFrame, text='Quicksave', command=self.saveState, width=10)
+        saveButton.grid(row=0, column=0)
+        loadButton = tk.Button(stateControlFrame, text='Load quicksave', command=self.loadState, width=10)
+        loadButton.grid(row=0, column=1)
+        clearButton = tk.Button(stateControlFrame, text='Clear state', command=self.clearState, width=10)
+        clearButton.grid(row=0, column=2)
+        rendererButton = tk.Button(stateControlFrame, text='Renderer', command=self.toggleRenderer, width=10)
+        rendererButton.grid(row=1, column=2)
+        self.viewStringVar = tk.StringVar()
+        viewLabel = tk.Label(stateControlFrame, textvariable=self.viewStringVar)
+        viewLabel.grid(row=2, column=0, columnspan=3)
+        self.fileStringVar = tk.StringVar()
+        fileLabel = tk.Label(stateControlFrame, textvariable=self.fileStringVar)
+        fileLabel.grid(row=4, column=0, columnspan=2)
+        cancelLoadButton = tk.Button(stateControlFrame, text='Cancel load', command=self.cancelLoad, width=10)
+        cancelLoadButton.grid(row=4, column=2)
+        self.hudVar = tk.BooleanVar()
+        hudButton = tk.Checkbutton(stateControlFrame, text='Performance overlay', variable=self.hudVar, command=self.toggleHud)
+        hudButton.grid(row=3, column=0, columnspan=3)
+        saveToFileButton = tk.Button(stateControlFrame, text='Save to file', command=self.saveStateToFile, width=10)
+        saveToFileButton.grid(row=1, column=0)
+        loadFromFileButton = tk.Button(stateControlFrame, text='Load from file', command=self.loadStateFromFile, width=10)
+        loadFromFileButton.grid(row=1, column=1)
+
+    def createCanvas(self):
+        self.canvas = tk.Canvas(self, width=CANVAS_SIZE[0], height=CANVAS_SIZE[1], bg='black', bd=2, relief="groove")
+        self.canvas.bind("<Button-1>", self.leftClickedCanvasCallback)
+        self.canvas.bind("<Button-3>", self.rightClickedCanvasCallback)
+        self.canvas.bind("<B1-Motion>", self.leftClickedCanvasCallback)
+        self.canvas.bind("<B3-Motion>", self.rightClickedCanvasCallback)
+        self.canvas.bind("<Button-4>", self.zoomIn)
+        self.canvas.bind("<Button-5>", self.zoomOut)
+        self.canvas.bind("<Key>", self.handleKey)
+        self.canvas.focus_set()
+        self.canvas.grid(row=1, column=0, columnspan=4)
+
+    def createBrushFrame(self):
+        brushFrame = tk.Frame(self, width=50)
+        brushFrame.grid(row=1, column=4, sticky="NW")
+
+        brushSizeFrame = tk.Frame(brushFrame)
+        brushSizeFrame.grid(row=0, column=0, sticky="NW", pady=(0, 20))
+        self.brushSizeVar = tk.StringVar()
+        self.updateBrushSizeLabel()
+        brushSizeLabel = tk.Label(brushSizeFrame, textvariable=self.brushSizeVar, anchor="w", width=20)
+        brushSizeLabel.grid(row=0, column=0, columnspan=2, sticky='W')
+        decreaseBrushSizeButton = tk.Button(brushSizeFrame, text='-', command=self.decreaseBrushSize, width=4)
+        decreaseBrushSizeButton.grid(row=1, column=0, sticky="W")
+        increaseBrushSizeButton = tk.Button(brushSizeFrame, text='+', command=self.increaseBrushSize, width=4)
+        increaseBrushSizeButton.grid(row=1, column=1, sticky="W")
+
+        brushRotFrame = tk.Frame(brushFrame)
+        brushRotFrame.grid(row=1, column=0, sticky="NW", pady=(0, 20))
+        self.brushRotVar = tk.StringVar()
+        self.updateBrushRotLabel()
+        brushRotLabel = tk.Label(brushRotFrame, textvariable=self.brushRotVar, anchor="w", width=28)
+        brushRotLabel.grid(row=0, column=0, columnspan=3, sticky='W')
+        rotateBrushLeftButton = tk.Button(brushRotFrame, text='<-', command=self.rotateBrushLeft, width=4)
+        rotateBrushLeftButton.grid(row=1, column=0, sticky='W')
+        rotateBrushRightButton = tk.Button(brushRotFrame, text='->', command=self.rotateBrushRight, width=4)
+        rotateBrushRightButton.grid(row=1, column=1, sticky="W")
+        mirrorBrushButton = tk.Button(brushRotFrame, text='Mirror', command=self.mirrorBrush, width=6)
+        mirrorBrushButton.grid(row=1, column=2, sticky="W")
+
+        brushTypeFrame = tk.Frame(brushFrame)
+        brushTypeFrame.grid(row=2, column=0, sticky="NW")
+        brushLabel = tk.Label(brushTypeFrame, text="Brushes:", anchor="w", width=20)
+        currow = 0
+        brushLabel.grid(row=currow, column=0, sticky="W")
+        defaultBrushButton = tk.Button(brushTypeFrame, text='Default brush', command=lambda: self.selectBrush(BrushType.default), width=12)
+        currow += 1
+        defaultBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        plusBrushButton = tk.Button(brushTypeFrame, text='Plus', command=lambda: self.selectBrush(BrushType.plus), width=12)
+        currow += 1
+        plusBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        brushLabel = tk.Label(brushTypeFrame, text="Oscillators:", anchor="w", width=20)
+        currow += 1
+        brushLabel.grid(row=currow, column=0, sticky="W")
+        blinkerBrushButton = tk.Button(brushTypeFrame, text='Blinker', command=lambda: self.selectBrush(BrushType.blinker), width=12)
+        currow += 1
+        blinkerBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        toadBrushButton = tk.Button(brushTypeFrame, text='Toad', command=lambda: self.selectBrush(BrushType.toad), width=12)
+        currow += 1
+        toadBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        beaconBrushButton = tk.Button(brushTypeFrame, text='Beacon', command=lambda: self.selectBrush(BrushType.beacon), width=12)
+        currow += 1
+        beaconBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        pulsarBrushButton = tk.Button(brushTypeFrame, text='Pulsar', command=lambda: self.selectBrush(BrushType.pulsar), width=12)
+        currow += 1
+        pulsarBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        portalBrushButton = tk.Button(brushTypeFrame, text='Portal', command=lambda: self.selectBrush(BrushType.portal), width=12)
+        currow += 1
+        portalBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        brushLabel = tk.Label(brushTypeFrame, text="Spaceships:", anchor="w", width=20)
+        currow += 1
+        brushLabel.grid(row=currow, column=0, sticky="W")
+        gliderBrushButton = tk.Button(brushTypeFrame, text='Glider', command=lambda: self.selectBrush(BrushType.glider), width=12)
+        currow += 1
+        gliderBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        lightshipBrushButton = tk.Button(brushTypeFrame, text='Light ship', command=lambda: self.selectBrush(BrushType.light_ship), width=12)
+        currow += 1
+        lightshipBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        heavyshipBrushButton = tk.Button(brushTypeFrame, text='Heavy ship', command=lambda: self.selectBrush(BrushType.heavy_ship), width=12)
+        currow += 1
+        heavyshipBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        brushLabel = tk.Label(brushTypeFrame, text="Guns:", anchor="w", width=20)
+        currow += 1
+        brushLabel.grid(row=currow, column=0, sticky="W")
+        gosperGlidergunBrushButton = tk.Button(brushTypeFrame, text='Gosper glider gun', command=lambda: self.selectBrush(BrushType.gosper_glider_gun), width=12)
+        currow += 1
+        gosperGlidergunBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+        simkinGlidergunBrushButton = tk.Button(brushTypeFrame, text='Simkin glider gun', command=lambda: self.selectBrush(BrushType.simkin_glider_gun), width=12)
+        currow += 1
+        simkinGlidergunBrushButton.grid(row=currow, column=0, columnspan=2, sticky="W")
+
+        self.importedBrushFrame = tk.Frame(brushFrame)
+        self.importedBrushFrame.grid(row=3, column=0, sticky="NW", pady=(20, 0))
+        self.importedBrushPaths = set()
+        importBrushButton = tk.Button(self.importedBrushFrame, text='Import brush', command=self.importBrush, width=12)
+        importBrushButton.grid(row=0, column=0, columnspan=2, sticky="W")
+        # pattern files imported in earlier runs, from the brush cache
+        for path in importedBrushes():
+            self.addImportedBrushButton(path)
+
+    def createWidgets(self):
+        self.createTopFrame()
+        self.createCanvas()
+        self.createBrushFrame()
+
+    ### Drawing ###
+    def toggleRenderer(self):
+        self.raster = not self.raster
+        self.refreshView()
+
+    def refreshView(self):
+        if self.densityShift is not None:
+            self.drawDensity()
+            return
+        if self.raster:
+            self.drawRaster()
+            return
+        self.canvas.delete(tk.ALL)
+        self.rasterImage = None
+        self.perfStats.itemsDeleted += len(self.cell_rectangles)
+        self.cell_rectangles = {}
+        self.drawGrid()
+        self.updateViewRect()
+        self.drawCells()
+
+    def moveView(self, viewOffset, cellsize, action, densityShift=None):
+        # pans and zooms keep what is already drawn: cells still in view are moved or
+        # rescaled, the ones that left are erased and only the exposed strips are queried
+        start = perf_counter()
+        if densityShift is not None or self.densityShift is not None:
+            self.setDensityShift(densityShift)
+            self.viewOffset, self.cellsize = viewOffset, cellsize
+            self.refreshView()
+            self.update_idletasks()
+            elapsed = (perf_counter() - start) * 1000
+            if densityShift is None:
+                self.viewStringVar.set(f"{action}: {elapsed:.1f} ms, full redraw")
+            else:
+                self.viewStringVar.set(f"{action}: {elapsed:.1f} ms, {1 << densityShift}x{1 << densityShift} cells per pixel")
+            return
+        with self.stateLock:
+            born, died = self.pendingBorn, self.pendingDied
+            self.pendingBorn, self.pendingDied = set(), set()
+            self.removeDeadCells(died)
+            self.addNewCells(born)
+            oldOffset, oldCellsize, oldRect = self.viewOffset, self.cellsize, self.viewRect
+            self.viewOffset, self.cellsize = viewOffset, cellsize
+            self.updateViewRect()
+            if self.raster and cellsize != oldCellsize:
+                self.drawRaster()
+                redrawn = None
+            else:
+                # cells at the far edges were only partly on screen, so they are drawn again whole
+                x0, y0 = oldRect[0], oldRect[1]
+                shown = (x0, y0, x0 + self.canvas.winfo_width() // oldCellsize, y0 + self.canvas.winfo_height() // oldCellsize)
+                left = [] if self.raster else [cell for rect in rectDifference(oldRect, self.viewRect) for cell in self.viewIndex.query(*rect)]
+                entered = [cell for rect in rectDifference(self.viewRect, shown) for cell in self.viewIndex.query(*rect)]
+                redrawn = len(left) + len(entered)
+        if redrawn is not None:
+            dx, dy = (viewOffset[0] - oldOffset[0])*cellsize, (viewOffset[1] - oldOffset[1])*cellsize
+            if self.raster:
+                self.shiftRaster(dx, dy)
+            else:
+                if cellsize != oldCellsize:
+                    self.canvas.scale(CELL_TAG, 0, 0, cellsize / oldCellsize, cellsize / oldCellsize)
+                    self.canvas.itemconfigure(GRID_TAG, image=self.gridPhoto())
+                self.canvas.move(CELL_TAG, dx, dy)
+                self.removeDeadCells(left)
+            self.addNewCells(entered)
+        self.update_idletasks()
+        elapsed = (perf_counter() - start) * 1000
+        if redrawn is None:
+            self.viewStringVar.set(f"{action}: {elapsed:.1f} ms, full redraw")
+        else:
+            self.viewStringVar.set(f"{action}: {elapsed:.1f} ms, {redrawn} cells redrawn")
+
+    def addCell(self, cell):
+        if self.raster:
+            self.paintCell(cell, RASTER_CELL_RGB)
+            return
+        if cell in self.cell_rectangles:
+            return
+        x = (cell[0] + self.viewOffset[0])*self.cellsize
+        y = (cell[1] + self.viewOffset[1])*self.cellsize
+        self.perfStats.itemsCreated += 1
+        self.cell_rectangles[cell] = self.canvas.create_rectangle(x, y, x + self.cellsize, y + self.cellsize, fill=CELL_COLOR, outline=GRID_COLOR, tags=CELL_TAG)
+
+    def eraseCell(self, cell):
+        if self.raster:
+            self.paintCell(cell, (0, 0, 0))
+        elif cell in self.cell_rectangles:
+            self.canvas.delete(self.cell_rectangles[cell])
+            del self.cell_rectangles[cell]
+            self.perfStats.itemsDeleted += 1
+
+    def interfaceAddCells(self, cells):
+        with self.stateLock:
+            added = self.gamestate.addCells(cells)
+            if added:
+                self.undoHistory.markEdited()
+                self.cycleDetector.edit(added, [])
+                self.queueChanges(added, [])
+
+    def addNewCells(self, cells):
+        for cell in cells:
+            self.addCell(cell)
+
+    def removeDeadCells(self, cells):
+        for cell in cells:
+            self.eraseCell(cell)
+
+    def drawCells(self):
+        for cell in self.visibleCells():
+            self.addCell(cell)
+
+    def gridImage(self, w, h):
+        # the empty grid at the current cell size, drawn once and reused by both renderers
+        key = (self.cellsize, w, h)
+        if key not in self.gridImages:
+            if len(self.gridImages) >= GRID_CACHE_SIZE:
+                oldest = next(iter(self.gridImages))
+                del self.gridImages[oldest]
+                self.gridPhotos.pop(oldest, None)
+            image = Image.new("RGB", (w, h))
+            draw = ImageDraw.Draw(image)
+            for i in range(0, w, self.cellsize):
+                draw.line([(i, 0), (i, h)], fill=RASTER_GRID_RGB)
+            for i in range(0, h, self.cellsize):
+                draw.line([(0, i), (w, i)], fill=RASTER_GRID_RGB)
+            self.gridImages[key] = image
+        return self.gridImages[key]
+
+    def gridPhoto(self):
+        w = self.canvas.winfo_width()
+        h = self.canvas.winfo_height()
+        image = self.gridImage(w, h)
+        key = (self.cellsize, w, h)
+        if key not in self.gridPhotos:
+            self.gridPhotos[key] = ImageTk.PhotoImage(image)
+        return self.gridPhotos[key]
+
+    def drawGrid(self):
+        self.update()
+        self.canvas.create_image(0, 0, image=self.gridPhoto(), anchor=tk.NW, tags=GRID_TAG)
+
+    ### Raster drawing ###
+    # The whole viewport is one PIL image with the grid baked in. Births and deaths
+    # repaint single cells in the image, and the image is blitted to Tk once per frame.
+    def drawRaster(self):
+        self.update()
+        w = self.canvas.winfo_width()
+        h = self.canvas.winfo_height()
+        self.perfStats.itemsDeleted += len(self.cell_rectangles)
+        self.cell_rectangles = {}
+        self.rasterImage = self.gridImage(w, h).copy()
+        self.rasterDraw = ImageDraw.Draw(self.rasterImage)
+        self.updateViewRect()
+        for cell in self.visibleCells():
+            self.paintCell(cell, RASTER_CELL_RGB)
+        self.rasterPhoto = ImageTk.PhotoImage(self.rasterImage)
+        self.canvas.delete(tk.ALL)
+        self.canvas.create_image(0, 0, image=self.rasterPhoto, anchor=tk.NW)
+        self.blitPending = False
+
+    def shiftRaster(self, dx, dy):
+        # moves the painted image by whole cells over a fresh grid, leaving the
+        # exposed strips empty for the newly visible cells
+        image = self.gridImage(self.rasterImage.width, self.rasterImage.height).copy()
+        image.paste(self.rasterImage, (dx, dy))
+        self.rasterImage = image
+        self.rasterDraw = ImageDraw.Draw(self.rasterImage)
+        self.blitRaster()
+
+    ### Density drawing ###
+    # Below the smallest cell size each pixel of the raster image is a block of cells,
+    # shaded by how many of them are alive. The counts come from densityPyramid, which
+    # only exists while the density view is shown.
+    def setDensityShift(self, densityShift):
+        with self.stateLock:
+            if densityShift is None:
+                self.densityPyramid = None
+            elif self.densityPyramid is None:
+                # from the view index, as the worker may be stepping the engine right now
+                self.densityPyramid = DensityPyramid(self.viewIndex)
+            self.densityShift = densityShift
+
+    def densityColor(self, count):
+        # brightness follows the square root of the live fraction, so sparse blocks still show
+        fraction = count / (1 << 2*self.densityShift)
+        shade = min(DENSITY_SHADES - 1, int(math.sqrt(fraction) * DENSITY_SHADES))
+        scale = 0.25 + 0.75 * shade / (DENSITY_SHADES - 1)
+        return tuple(int(c * scale) for c in RASTER_CELL_RGB)
+
+    def densityBlocks(self, x0, y0, x1, y1):
+        # occupied blocks in the given range of block coordinates as (x, y, count)
+        if self.densityShift == 0:
+            return [(x, y, 1) for x, y in self.viewIndex.query(x0, y0, x1, y1)]
+        return self.densityPyramid.query(self.densityShift, x0, y0, x1, y1)
+
+    def drawDensity(self):
+        self.update()
+        w = self.canvas.winfo_width()
+        h = self.canvas.winfo_height()
+        self.perfStats.itemsDeleted += len(self.cell_rectangles)
+        self.cell_rectangles = {}
+        self.rasterImage = Image.new("RGB", (w, h))
+        self.rasterDraw = ImageDraw.Draw(self.rasterImage)
+        self.updateViewRect()
+        shift = self.densityShift
+        bx, by = self.viewRect[0] >> shift, self.viewRect[1] >> shift
+        with self.stateLock:
+            self.pendingBorn, self.pendingDied = set(), set()
+            blocks = self.densityBlocks(bx, by, bx + w, by + h)
+        pixels = self.rasterImage.load()
+        colors = {}
+        for x, y, count in blocks:
+            color = colors.get(count)
+            if color is None:
+                color = colors[count] = self.densityColor(count)
+            pixels[x - bx, y - by] = color
+        self.rasterPhoto = ImageTk.PhotoImage(self.rasterImage)
+        self.canvas.delete(tk.ALL)
+        self.canvas.create_image(0, 0, image=self.rasterPhoto, anchor=tk.NW)
+        self.blitPending = False
+
+    def paintDensity(self, cells):
+        if not cells:
+            return
+        shift = self.densityShift
+        bx, by = self.viewRect[0] >> shift, self.viewRect[1] >> shift
+        w, h = self.rasterImage.size
+        pixels = self.rasterImage.load()
+        with self.stateLock:
+            for x, y in {(x >> shift, y >> shift) for x, y in cells}:
+                if 0 <= x - bx < w and 0 <= y - by < h:
+                    if shift == 0:
+                        count = 1 if (x, y) in self.viewIndex else 0
+                    else:
+                        count = self.densityPyramid.levels[shift].get((x, y), 0)
+                    pixels[x - bx, y - by] = self.densityColor(count) if count else (0, 0, 0)
+        if not self.blitPending:
+            self.blitPending = True
+            self.after_idle(self.blitRaster)
+
+    def paintCell(self, cell, color):
+        x = (cell[0] + self.viewOffset[0])*self.cellsize
+        y = (cell[1] + self.viewOffset[1])*self.cellsize
+        if x < 0 or y < 0 or x >= self.rasterImage.width or y >= self.rasterImage.height:
+            return
+        self.rasterDraw.rectangle([x, y, x + self.cellsize, y + self.cellsize], fill=color, outline=RASTER_GRID_RGB)
+        if not self.blitPending:
+            self.blitPending = True
+            self.after_idle(self.blitRaster)
+
+    def blitRaster(self):
+        self.blitPending = False
+        if self.rasterImage is not None:
+            self.rasterPhoto.paste(self.rasterImage)
+
+def main(engine=DEFAULT_ENGINE, renderer=DEFAULT_RENDERER, hud=False, metrics=None, profile=0, profileOutput=PROFILE_OUTPUT,
+         workers=None, tileSize=PARALLEL_TILE_SIZE):
+    root = tk.Tk()
+    app = Application(root, engine, renderer, workers, tileSize)
+    app.master.title("Game of Life")
+    if hud:
+        app.hudVar.set(True)
+        app.toggleHud()
+    if metrics:
+        app.openMetrics(metrics)
+    if profile:
+        app.startProfile(profile, profileOutput)
+    app.after(0, app.renderLoop)
+    app.mainloop()
+    app.shutdown()
+
+if __name__ == "__main__":
+    main()